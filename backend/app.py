@@ -1,51 +1,62 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 import pandas as pd
 import json
-from pymongo import MongoClient
 from datetime import datetime
 import re
-from models.conversation import ConversationManager
+import hashlib
+import threading
+from models.catalog import catalog_jobs, warm_process_caches
+from models.database import get_database
+from models.storage import STORAGE_BACKEND, get_catalog, get_conversation_store
 from services.chat_service import ChatbotService
+from services import json_encoding, profiling
+from services.scheduler import JobScheduler
 from bson import ObjectId, json_util
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+app.json = json_encoding.FastJSONProvider(app)
+CORS(app, expose_headers=["ETag", "X-Next-Cursor"])
 
-# Initialize conversation manager
-conversation_manager = ConversationManager()
+# Initialize conversation manager (connects lazily; schema is provisioned by migrate_conversations.py)
+# STORAGE_BACKEND=memory runs without MongoDB; see models/storage.py
+conversation_manager = get_conversation_store()
 
+# Every serving worker warms its own caches; the lease holder also refreshes precomputed_results.
+# Never started on import: `python app.py` starts it unless SCHEDULER_ENABLED=false, other servers
+# (gunicorn) opt in with SCHEDULER_ENABLED=true and start it on their first request.
+scheduler = None
+_scheduler_lock = threading.Lock()
 
-# MongoDB Connection
-def get_mongodb_client():
-    """Get MongoDB client connection"""
-    mongodb_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
-    client = MongoClient(mongodb_uri)
-    return client
 
+def _scheduler_enabled(default):
+    return os.getenv("SCHEDULER_ENABLED", default).lower() in ("1", "true", "yes")
 
-def get_database():
-    """Get ecommerce database"""
-    client = get_mongodb_client()
-    return client["ecommerce"]
 
+def start_scheduler():
+    """Start this process's precompute scheduler once (MongoDB backend only)"""
+    global scheduler
+    if STORAGE_BACKEND != "mongo":
+        return None
+    with _scheduler_lock:
+        if scheduler is None:
+            scheduler = JobScheduler(
+                get_database(),
+                catalog_jobs(),
+                lease_id="catalog_precompute",
+                on_start=lambda: warm_process_caches(get_database()),
+            ).start()
+    return scheduler
 
-# Database Collections
-def get_collections():
-    """Get all database collections"""
-    db = get_database()
-    return {
-        "products": db.products,
-        "orders": db.orders,
-        "order_items": db.order_items,
-        "users": db.users,
-        "inventory_items": db.inventory_items,
-        "distribution_centers": db.distribution_centers,
-    }
+
+@app.before_request
+def _start_scheduler_on_first_request():
+    if scheduler is None and STORAGE_BACKEND == "mongo" and _scheduler_enabled("false"):
+        start_scheduler()
 
 
 # API Routes
@@ -57,6 +68,7 @@ def chat():
     query = data.get("message", "")
     user_id = data.get("user_id", "anonymous")
     conversation_id = data.get("conversation_id")
+    use_llm = data.get("use_llm", True)
     
     if not query:
         return jsonify({"error": "No message provided"}), 400
@@ -76,16 +88,22 @@ def chat():
         )
         
         # Get LLM-powered chatbot response
-        collections = get_collections()
-        chatbot = ChatbotService(collections, conversation_manager)
-        response = chatbot.process_query(query, conversation_id)
+        chatbot = ChatbotService(get_catalog(), conversation_manager)
+        # Timings are always collected; cProfile only when sampled or an admin asks for it with X-Profile
+        with profiling.profile_request(
+            "chat",
+            profile=profiling.should_profile(request.headers, allow_header=_admin_allowed()),
+            metadata={"query": query, "use_llm": use_llm, "conversation_id": conversation_id},
+        ) as request_profile:
+            response = chatbot.process_query(query, conversation_id, use_llm=use_llm, user_id=user_id)
+            request_profile.token_usage = response.get("usage", {})
         
         # Save assistant response
         conversation_manager.add_message(
             conversation_id,
             "assistant",
             response["response"],
-            {"response_type": response.get("type", "general")}
+            {"response_type": response.get("type", "general"), "mode": response.get("mode", "llm")}
         )
         
         # Add conversation_id to response
@@ -97,44 +115,45 @@ def chat():
         return jsonify({"error": f"Chat processing failed: {str(e)}"}), 500
 
 
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+
+def _page_size(default=50):
+    return max(1, min(request.args.get("limit", default, type=int), MAX_PAGE_SIZE))
+
+
+def _conditional_json(payload):
+    """JSON response with an ETag that answers If-None-Match with 304"""
+    response = jsonify(payload)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def _stream_ndjson(name, cursor_factory):
+    version = get_catalog().data_version(name)
+    etag = hashlib.sha1(version.encode()).hexdigest() if version is not None else None
+    if etag and etag in request.if_none_match:
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+    def generate():
+        for document in cursor_factory():
+            yield json_encoding.dumps(document) + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    if etag:
+        response.set_etag(etag)
+    response.headers["Content-Disposition"] = f"attachment; filename={name}.ndjson"
+    return response
+
+
 @app.route("/api/products", methods=["GET"])
 def get_products():
     """Get available products from inventory"""
     try:
-        # Get unique products from inventory
-        pipeline = [
-            {
-                "$group": {
-                    "_id": {
-                        "product_name": "$product_name",
-                        "product_brand": "$product_brand",
-                        "product_category": "$product_category",
-                        "product_retail_price": "$product_retail_price",
-                    },
-                    "total_items": {"$sum": 1},
-                    "available_stock": {
-                        "$sum": {"$cond": [{"$eq": ["$sold_at", None]}, 1, 0]}
-                    },
-                }
-            },
-            {"$limit": 50},
-        ]
-
-        products = list(get_collections()["inventory_items"].aggregate(pipeline))
-
-        return jsonify(
-            [
-                {
-                    "name": p["_id"]["product_name"],
-                    "brand": p["_id"]["product_brand"],
-                    "category": p["_id"]["product_category"],
-                    "price": p["_id"]["product_retail_price"],
-                    "total_items": p["total_items"],
-                    "available_stock": p["available_stock"],
-                }
-                for p in products
-            ]
-        )
+        limit = _page_size()
+        skip = max(0, request.args.get("skip", 0, type=int))
+        return _conditional_json(list(get_catalog().product_rows(limit=limit, skip=skip)))
     except Exception as e:
         return jsonify({"error": f"Failed to fetch products: {str(e)}"}), 500
 
@@ -143,27 +162,36 @@ def get_products():
 def get_orders():
     """Get recent orders"""
     try:
-        orders = list(get_collections()["orders"].find().limit(50))
-
-        return jsonify(
-            [
-                {
-                    "id": o["order_id"],
-                    "user_id": o["user_id"],
-                    "status": o["status"],
-                    "gender": o["gender"],
-                    "num_of_item": o["num_of_item"],
-                    "created_at": o["created_at"],
-                    "shipped_at": o.get("shipped_at"),
-                    "delivered_at": o.get("delivered_at"),
-                }
-                for o in orders
-            ]
-        )
+        limit = _page_size()
+        after = request.args.get("after", type=int)
+        orders = list(get_catalog().order_rows(after=after, limit=limit))
+
+        response = _conditional_json(orders)
+        if len(orders) == limit:
+            response.headers["X-Next-Cursor"] = str(orders[-1]["id"])
+        return response
     except Exception as e:
         return jsonify({"error": f"Failed to fetch orders: {str(e)}"}), 500
 
 
+@app.route("/api/export/products", methods=["GET"])
+def export_products():
+    """Stream the full product catalog as NDJSON"""
+    try:
+        return _stream_ndjson("products", lambda: get_catalog().product_rows(batch_size=EXPORT_BATCH_SIZE))
+    except Exception as e:
+        return jsonify({"error": f"Failed to export products: {str(e)}"}), 500
+
+
+@app.route("/api/export/orders", methods=["GET"])
+def export_orders():
+    """Stream all orders as NDJSON"""
+    try:
+        return _stream_ndjson("orders", lambda: get_catalog().order_rows(batch_size=EXPORT_BATCH_SIZE))
+    except Exception as e:
+        return jsonify({"error": f"Failed to export orders: {str(e)}"}), 500
+
+
 # Conversation Management Endpoints
 
 @app.route("/api/conversations", methods=["POST"])
@@ -266,18 +294,58 @@ def get_user_statistics(user_id):
         return jsonify({"error": f"Failed to fetch statistics: {str(e)}"}), 500
 
 
+# Admin endpoints (disabled unless ADMIN_TOKEN is set; send it as X-Admin-Token)
+
+def _admin_allowed():
+    token = os.getenv("ADMIN_TOKEN")
+    return bool(token) and request.headers.get("X-Admin-Token") == token
+
+
+@app.route("/api/admin/profiles", methods=["GET"])
+def list_profiles():
+    """Recent profiled and slow requests, newest first"""
+    if not _admin_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(profiling.list_profiles())
+
+
+@app.route("/api/admin/profiles/<profile_id>", methods=["GET"])
+def download_profile(profile_id):
+    """One saved profile: JSON report by default, raw cProfile data with ?format=prof"""
+    if not _admin_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    extension = ".prof" if request.args.get("format") == "prof" else ".json"
+    path = profiling.profile_path(profile_id, extension)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(os.path.abspath(path), as_attachment=extension == ".prof")
+
+
+@app.route("/api/admin/jobs", methods=["GET"])
+def list_jobs():
+    """Precompute job durations and staleness, and which worker holds the scheduler lease"""
+    if not _admin_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    if scheduler is None:
+        return jsonify({"error": "Scheduler is not running"}), 404
+    try:
+        return jsonify(scheduler.status())
+    except Exception as e:
+        return jsonify({"error": f"Failed to fetch job status: {str(e)}"}), 500
+
+
 @app.route("/api/health", methods=["GET"])
 def health_check():
     """Health check endpoint"""
+    database = "MongoDB" if STORAGE_BACKEND == "mongo" else "in-memory"
     try:
-        # Test MongoDB connection
-        client = get_mongodb_client()
-        client.admin.command("ping")
+        # Test the storage backend (a MongoDB ping unless running in memory)
+        get_catalog().ping()
         return jsonify(
             {
                 "status": "healthy",
-                "message": "Chatbot API is running with MongoDB",
-                "database": "MongoDB",
+                "message": f"Chatbot API is running with {database} storage",
+                "database": database,
             }
         )
     except Exception as e:
@@ -285,8 +353,8 @@ def health_check():
             jsonify(
                 {
                     "status": "unhealthy",
-                    "message": f"MongoDB connection failed: {str(e)}",
-                    "database": "MongoDB",
+                    "message": f"{database} connection failed: {str(e)}",
+                    "database": database,
                 }
             ),
             500,
@@ -294,4 +362,7 @@ def health_check():
 
 
 if __name__ == "__main__":
+    # With debug=True the reloader parent only watches files; the serving child has WERKZEUG_RUN_MAIN set
+    if _scheduler_enabled("true") and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_scheduler()
     app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
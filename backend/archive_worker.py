@@ -0,0 +1,42 @@
+"""Archive idle conversations and drain the conversation deletion queue.
+
+    python archive_worker.py            # loop forever
+    python archive_worker.py --once     # single pass (e.g. from cron)
+
+Conversations idle for ARCHIVE_AFTER_DAYS have their messages compressed into
+archived_messages; reads merge them back in front of any newer live messages.
+Deleted conversations are only queued by the API, so this worker must run for
+their messages to be removed (docker-compose starts it as archive-worker).
+"""
+import os
+import sys
+import time
+from dotenv import load_dotenv
+from models.archive import ConversationArchiver
+from models.database import get_database
+
+load_dotenv()
+
+ARCHIVE_WORKER_INTERVAL = int(os.getenv("ARCHIVE_WORKER_INTERVAL", 300))
+
+
+def run_once(archiver):
+    deleted = archiver.process_deletions()
+    archived = archiver.archive_idle()
+    print(f"🗄️ Archived {archived} conversations, deleted {deleted} messages")
+
+
+if __name__ == "__main__":
+    archiver = ConversationArchiver(get_database())
+
+    if "--once" in sys.argv:
+        run_once(archiver)
+        sys.exit(0)
+
+    print("🗄️ Archive worker started")
+    try:
+        while True:
+            run_once(archiver)
+            time.sleep(ARCHIVE_WORKER_INTERVAL)
+    except KeyboardInterrupt:
+        print("👋 Archive worker stopped")
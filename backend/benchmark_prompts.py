@@ -0,0 +1,117 @@
+"""Compare response-prompt size (and optionally LLM latency) before and after compact serialization.
+
+    python benchmark_prompts.py            # token counts only
+    python benchmark_prompts.py --llm 5    # also time 5 LLM calls per prompt
+"""
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("LLM_DISABLED", "true")
+
+from services.chat_service import ChatbotService
+from services.prompt_serializer import serialize_data_context, compact_conversation, estimate_tokens
+
+
+def sample_item(i, brand="Levi's", category="Jeans", **counts):
+    return {
+        "_id": {
+            "product_name": f"Levi's Men's 50{i} Original Fit Jean - Dark Stonewash",
+            "product_brand": brand,
+            "product_category": category,
+            "product_retail_price": 49.5 + i,
+        },
+        **counts,
+    }
+
+
+SAMPLE_CONTEXTS = {
+    "products": {"type": "products", "content": [sample_item(i, total_items=12, available_stock=i + 2) for i in range(5)]},
+    "stock": {"type": "stock", "search_term": "501 jean", "content": [sample_item(i, stock_count=i * 3) for i in range(3)]},
+    "top_products": {"type": "top_products", "content": [
+        sample_item(i, brand=f"Brand {i}", category="Tops & Tees", sold_count=40 - i) for i in range(5)
+    ]},
+    "category": {"type": "category", "category": "Jeans", "content": [sample_item(i, available_stock=i) for i in range(10)]},
+    "order": {"type": "order", "order_id": 12345, "content": {
+        "status": "Shipped", "num_of_item": 2, "created_at": "2023-03-14 09:12:00+00:00",
+        "shipped_at": "2023-03-15 10:00:00+00:00", "delivered_at": None,
+    }},
+}
+
+SAMPLE_MESSAGES = [
+    {"type": "user", "content": "Do you have any Levi's jeans?"},
+    {"type": "assistant", "content": "Yes! Here are some Levi's jeans we currently carry: " + "details " * 60},
+    {"type": "user", "content": "What about the 501 in dark stonewash?"},
+    {"type": "assistant", "content": "The Levi's 501 Original Fit in Dark Stonewash is available. " + "more " * 60},
+    {"type": "user", "content": "How many are left?"},
+    {"type": "assistant", "content": "There are 6 units in stock."},
+]
+
+QUERY = "How many of the 501 jeans are left in stock?"
+
+
+def legacy_prompt(summary, messages):
+    """Response prompt as built before compact serialization"""
+    context = "Previous conversation:\n"
+    for msg in messages:
+        role = "User" if msg["type"] == "user" else "Assistant"
+        context += f"{role}: {msg['content']}\n"
+    return f"""
+User Query: {QUERY}
+
+Available Data: {summary}
+
+Conversation Context: {context}
+
+Please provide a helpful response based on the available data."""
+
+
+def compact_prompt(data_context, messages):
+    return "\n\n".join([
+        f"User Query: {QUERY}",
+        f"Available Data:\n{serialize_data_context(data_context)}",
+        f"Conversation Context:\n{compact_conversation(messages)}",
+        "Please provide a helpful response based on the available data.",
+    ])
+
+
+def time_llm(prompt, runs):
+    from services.llm_client import get_llm_client
+
+    client = get_llm_client()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        client.chat(
+            messages=[{"role": "user", "content": prompt}],
+            model="llama3-8b-8192",
+            temperature=0.3,
+            max_tokens=200,
+        )
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm", type=int, default=0, help="LLM calls per prompt to time (needs GROQ_API_KEY or GROQ_BASE_URL)")
+    args = parser.parse_args()
+
+    chatbot = ChatbotService(catalog=None, conversation_manager=None)
+
+    print(f"{'type':<14}{'before':>8}{'after':>8}{'saved':>8}" + (f"{'before ms':>12}{'after ms':>10}" if args.llm else ""))
+    total_before = total_after = 0
+    for name, data_context in SAMPLE_CONTEXTS.items():
+        before = legacy_prompt(chatbot._format_data_summary(data_context), SAMPLE_MESSAGES)
+        after = compact_prompt(data_context, SAMPLE_MESSAGES)
+        before_tokens, after_tokens = estimate_tokens(before), estimate_tokens(after)
+        total_before += before_tokens
+        total_after += after_tokens
+
+        row = f"{name:<14}{before_tokens:>8}{after_tokens:>8}{1 - after_tokens / before_tokens:>8.0%}"
+        if args.llm:
+            row += f"{time_llm(before, args.llm):>12.0f}{time_llm(after, args.llm):>10.0f}"
+        print(row)
+
+    print(f"{'total':<14}{total_before:>8}{total_after:>8}{1 - total_after / total_before:>8.0%}")
@@ -0,0 +1,90 @@
+"""Compare product retrieval: substring regex on product_name vs the hashed TF-IDF vector index.
+
+    python benchmark_retrieval.py            # default labelled queries, k=5
+    python benchmark_retrieval.py --runs 20  # more timing runs per query
+
+Needs a loaded database with inventory_counters built (python load_data.py).
+A result counts as relevant when its category contains the query's expected
+category, so "hit@k" is the share of the top k that are relevant.
+"""
+import argparse
+import statistics
+import time
+from dotenv import load_dotenv
+from models.database import get_database
+from services.product_index import ProductIndex
+
+load_dotenv()
+
+# (query, expected category substring)
+LABELLED_QUERIES = [
+    ("warm winter coat", "Coats"),
+    ("denim jeans", "Jeans"),
+    ("wool sweater", "Sweaters"),
+    ("running shorts", "Shorts"),
+    ("hoodie", "Hoodies"),
+    ("swim trunks", "Swim"),
+    ("levis 501", "Jeans"),
+    ("sports bra", "Intimates"),
+    ("socks", "Socks"),
+    ("sleep pants", "Sleep"),
+]
+
+
+def regex_search(db, query, k):
+    pipeline = [
+        {"$match": {"product_name": {"$regex": query, "$options": "i"}}},
+        {"$group": {"_id": "$product_id", "product_category": {"$first": "$product_category"}}},
+        {"$limit": k},
+    ]
+    return [item["product_category"] for item in db.inventory_items.aggregate(pipeline)]
+
+
+def vector_search(db, index, query, k):
+    product_ids = index.search_products(query, k)
+    if not product_ids:
+        return []
+    pipeline = [
+        {"$match": {"product_id": {"$in": product_ids}}},
+        {"$group": {"_id": "$product_id", "product_category": {"$first": "$product_category"}}},
+    ]
+    return [item["product_category"] for item in db.inventory_items.aggregate(pipeline)]
+
+
+def measure(search, query, expected, k, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        categories = search(query, k)
+        timings.append((time.perf_counter() - started) * 1000)
+    hits = sum(1 for category in categories if expected.lower() in (category or "").lower())
+    return statistics.median(timings), hits / k, len(categories)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    db = get_database()
+    started = time.perf_counter()
+    index = ProductIndex(db)
+    index.refresh()
+    print(f"Built index over {len(index.products):,} products in {time.perf_counter() - started:.2f}s\n")
+
+    print(f"{'query':<20}{'regex ms':>10}{'hit@k':>7}{'found':>7}{'vector ms':>11}{'hit@k':>7}{'found':>7}")
+    totals = {"regex": [], "vector": []}
+    for query, expected in LABELLED_QUERIES:
+        regex = measure(lambda q, k: regex_search(db, q, k), query, expected, args.k, args.runs)
+        vector = measure(lambda q, k: vector_search(db, index, q, k), query, expected, args.k, args.runs)
+        totals["regex"].append(regex)
+        totals["vector"].append(vector)
+        print(f"{query:<20}{regex[0]:>10.1f}{regex[1]:>7.0%}{regex[2]:>7}{vector[0]:>11.1f}{vector[1]:>7.0%}{vector[2]:>7}")
+
+    summary = {
+        name: (statistics.median(r[0] for r in rows), statistics.mean(r[1] for r in rows))
+        for name, rows in totals.items()
+    }
+    print(f"\n{'median/mean':<20}{summary['regex'][0]:>10.1f}{summary['regex'][1]:>7.0%}{'':>7}"
+          f"{summary['vector'][0]:>11.1f}{summary['vector'][1]:>7.0%}")
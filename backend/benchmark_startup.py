@@ -0,0 +1,50 @@
+"""Measure per-worker startup cost: importing the app and serving its first database call.
+
+    python benchmark_startup.py --workers 4
+    python benchmark_startup.py --workers 4 --eager    # include schema provisioning, as startup used to
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+WORKER_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+if {eager}:
+    from models.schema import apply_schema
+    apply_schema(app.get_database())
+provisioned = time.perf_counter()
+app.conversation_manager.db.command("ping")
+first_call = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "schema_ms": (provisioned - imported) * 1000,
+    "first_call_ms": (first_call - provisioned) * 1000,
+    "total_ms": (first_call - started) * 1000,
+}}))
+"""
+
+
+def run_worker(eager):
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER_SCRIPT.format(eager=eager)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="Fresh worker processes to start")
+    parser.add_argument("--eager", action="store_true", help="Provision schema during startup")
+    args = parser.parse_args()
+
+    results = [run_worker(args.eager) for _ in range(args.workers)]
+    print(f"⏱️ Startup over {args.workers} workers ({'eager' if args.eager else 'lazy'} schema):")
+    for key in ("import_ms", "schema_ms", "first_call_ms", "total_ms"):
+        values = [result[key] for result in results]
+        print(f"  {key:<14} median={statistics.median(values):8.1f}  max={max(values):8.1f}")
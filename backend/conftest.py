@@ -0,0 +1 @@
+# Lets the tests import backend modules (services, models, fake_llm_server) when pytest runs from backend/
@@ -0,0 +1,76 @@
+"""Local stand-in for the Groq chat completions API with injectable latency and errors.
+
+Point the backend at it with GROQ_BASE_URL=http://localhost:8089 and GROQ_API_KEY=fake.
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.2
+    jitter = 0.0
+    error_rate = 0.0
+    error_status = 503
+    reply = "This is a canned response from the fake LLM server."
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self._send(404, {"error": {"message": "Not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if random.random() < self.error_rate:
+            self._send(self.error_status, {"error": {"message": "Injected failure", "type": "server_error"}})
+            return
+
+        content = self.reply
+        if body.get("response_format", {}).get("type") == "json_object":
+            content = json.dumps({"intents": [{"type": "product_search", "terms": []}], "ask": None})
+
+        self._send(200, {
+            "id": f"chatcmpl-fake-{random.randint(0, 10**9)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-model"),
+            "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Groq-compatible LLM server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="Base latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected failures")
+    args = parser.parse_args()
+
+    FakeLLMHandler.latency = args.latency
+    FakeLLMHandler.jitter = args.jitter
+    FakeLLMHandler.error_rate = args.error_rate
+    FakeLLMHandler.error_status = args.error_status
+
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), FakeLLMHandler)
+    print(f"🤖 Fake LLM server listening on port {args.port}")
+    server.serve_forever()
@@ -0,0 +1,305 @@
+"""Explain every query the app issues, flag collection scans and in-memory sorts, and propose indexes.
+
+    python index_advisor.py                     # audit and write a report
+    python index_advisor.py --apply             # also create the proposed indexes
+    python index_advisor.py --drop-redundant    # also drop indexes that are prefixes of others
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+from pymongo import MongoClient
+from services.order_lookup import RECENT_ORDERS_LIMIT, order_detail_pipeline
+
+REPORT_DIR = "reports"
+
+# Range-style operators: these fields go last in an Equality-Sort-Range compound index
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$ne", "$nin", "$exists", "$regex", "$type"}
+
+
+def get_database():
+    """Get ecommerce database"""
+    mongodb_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+    return MongoClient(mongodb_uri)["ecommerce"]
+
+
+def sample_values(db):
+    """Real values to plug into parameterized queries so explain sees realistic selectivity"""
+    item = db.inventory_items.find_one({}, {"product_id": 1, "product_name": 1, "product_category": 1}) or {}
+    conversation = db.conversations.find_one({}, {"user_id": 1}) or {}
+    order = db.orders.find_one({}, {"order_id": 1, "user_id": 1}) or {}
+    return {
+        "product_name": (item.get("product_name") or "jacket").split()[0],
+        "category": item.get("product_category") or "Jeans",
+        "product_id": item.get("product_id", "1"),
+        "user_id": conversation.get("user_id", "anonymous"),
+        "conversation_id": conversation.get("_id"),
+        "order_id": order.get("order_id", 1),
+        "order_user_id": order.get("user_id", 1),
+    }
+
+
+def query_catalog(s):
+    """Every find/aggregate the app issues, in the shape it issues them"""
+    product_group = {
+        "$group": {
+            "_id": {
+                "product_name": "$product_name",
+                "product_brand": "$product_brand",
+                "product_retail_price": "$product_retail_price",
+            },
+            "count": {"$sum": 1},
+        }
+    }
+    return [
+        {"name": "chat.product_search", "collection": "inventory_items", "pipeline": [
+            {"$match": {"product_name": {"$regex": s["product_name"], "$options": "i"}}}, product_group, {"$limit": 5}]},
+        {"name": "chat.product_search_ranked", "collection": "inventory_items", "pipeline": [
+            {"$match": {"product_id": {"$in": [s["product_id"]]}}}, product_group, {"$limit": 5}]},
+        {"name": "chat.stock_check", "collection": "inventory_items", "pipeline": [
+            {"$match": {"product_name": {"$regex": s["product_name"], "$options": "i"}, "sold_at": {"$exists": False}}},
+            product_group, {"$limit": 3}]},
+        {"name": "chat.top_products", "collection": "inventory_items", "pipeline": [
+            {"$match": {"sold_at": {"$exists": True, "$ne": None}}}, product_group,
+            {"$sort": {"count": -1}}, {"$limit": 5}]},
+        {"name": "chat.category_browse", "collection": "inventory_items", "pipeline": [
+            {"$match": {"product_category": {"$regex": s["category"], "$options": "i"}}}, product_group, {"$limit": 10}]},
+        {"name": "chat.order_details", "collection": "orders", "pipeline": order_detail_pipeline(
+            {"order_id": {"$in": [int(s["order_id"]), str(s["order_id"])]}})},
+        {"name": "chat.recent_orders", "collection": "orders", "pipeline": [
+            {"$match": {"user_id": {"$in": [int(s["order_user_id"]), str(s["order_user_id"])]}}},
+            {"$sort": {"created_at": -1}}, {"$limit": RECENT_ORDERS_LIMIT}] + order_detail_pipeline({})[1:]},
+        {"name": "api.products", "collection": "inventory_items", "pipeline": [product_group, {"$limit": 50}],
+         "full_scan_expected": True},
+        {"name": "api.orders", "collection": "orders", "filter": {}, "limit": 50, "full_scan_expected": True},
+        {"name": "conversations.by_user", "collection": "conversations",
+         "filter": {"user_id": s["user_id"]}, "sort": {"last_activity": -1}, "limit": 20},
+        {"name": "conversations.statistics", "collection": "user_stats", "filter": {"_id": s["user_id"]}, "limit": 1},
+        {"name": "conversations.reconcile_user_stats", "collection": "conversations", "pipeline": [
+            {"$match": {"user_id": s["user_id"]}},
+            {"$group": {"_id": "$user_id", "total_conversations": {"$sum": 1}, "total_messages": {"$sum": "$message_count"},
+                        "first_conversation": {"$min": "$created_at"}, "last_conversation": {"$max": "$created_at"}}}]},
+        {"name": "messages.by_conversation", "collection": "messages",
+         "filter": {"conversation_id": s["conversation_id"]}, "sort": {"timestamp": 1}, "limit": 50},
+        {"name": "messages.last_message", "collection": "messages",
+         "filter": {"conversation_id": s["conversation_id"]}, "sort": {"timestamp": -1}, "limit": 1},
+    ]
+
+
+def _walk_stages(plan):
+    """Yield every stage name in a (classic or SBE) winning plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for key, value in plan.items():
+            if key in ("inputStage", "inputStages", "queryPlan", "innerStage", "outerStage", "thenStage", "elseStage"):
+                yield from _walk_stages(value)
+    elif isinstance(plan, list):
+        for child in plan:
+            yield from _walk_stages(child)
+
+
+def _find_key(document, key):
+    """Depth-first search for the first value stored under key"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        for value in document.values():
+            found = _find_key(value, key)
+            if found is not None:
+                return found
+    elif isinstance(document, list):
+        for value in document:
+            found = _find_key(value, key)
+            if found is not None:
+                return found
+    return None
+
+
+def _split_pipeline(spec):
+    """Filter and sort the query planner actually sees for a find or an aggregation"""
+    if "pipeline" not in spec:
+        return spec.get("filter", {}), spec.get("sort", {})
+
+    pipeline = spec["pipeline"]
+    query_filter, sort = {}, {}
+    if pipeline and "$match" in pipeline[0]:
+        query_filter = pipeline[0]["$match"]
+        if len(pipeline) > 1 and "$sort" in pipeline[1]:
+            sort = pipeline[1]["$sort"]
+    elif pipeline and "$sort" in pipeline[0]:
+        sort = pipeline[0]["$sort"]
+    return query_filter, sort
+
+
+def propose_index(spec):
+    """Equality-Sort-Range compound index (plus partial filter for existence checks) for a query"""
+    query_filter, sort = _split_pipeline(spec)
+    equality, ranges, partial = [], [], {}
+
+    for field, condition in query_filter.items():
+        if field.startswith("$"):
+            continue
+        if isinstance(condition, dict) and any(op in RANGE_OPERATORS for op in condition):
+            ranges.append(field)
+            if condition.get("$exists") is True:
+                partial[field] = {"$exists": True}
+        else:
+            equality.append(field)
+
+    keys = [(field, 1) for field in equality]
+    keys += [(field, direction) for field, direction in sort.items() if field not in equality]
+    keys += [(field, 1) for field in ranges if field not in sort]
+    if not keys:
+        return None
+
+    proposal = {"keys": keys}
+    if partial:
+        proposal["partialFilterExpression"] = partial
+    return proposal
+
+
+def explain(db, spec):
+    if "pipeline" in spec:
+        command = {"aggregate": spec["collection"], "pipeline": spec["pipeline"], "cursor": {}}
+    else:
+        command = {"find": spec["collection"], "filter": spec.get("filter", {})}
+        if spec.get("sort"):
+            command["sort"] = spec["sort"]
+        if spec.get("limit"):
+            command["limit"] = spec["limit"]
+    return db.command("explain", command, verbosity="executionStats")
+
+
+def _index_covers(existing_keys, proposed_keys):
+    """An existing index serves the proposal if the proposal is a prefix of it"""
+    return existing_keys[: len(proposed_keys)] == proposed_keys
+
+
+def audit_query(db, spec, existing_indexes):
+    plan = explain(db, spec)
+    stages = list(_walk_stages(_find_key(plan, "winningPlan")))
+    stats = _find_key(plan, "executionStats") or {}
+
+    collscan = "COLLSCAN" in stages
+    in_memory_sort = "SORT" in stages
+    issues = []
+    if collscan and not spec.get("full_scan_expected"):
+        issues.append("COLLSCAN")
+    if in_memory_sort:
+        issues.append("IN_MEMORY_SORT")
+
+    proposal = None
+    if issues:
+        proposal = propose_index(spec)
+        indexed = [[tuple(key) for key in index["key"]] for index in existing_indexes.values()]
+        if proposal and any(_index_covers(keys, proposal["keys"]) for keys in indexed):
+            # An index already exists; the planner is avoiding it (e.g. unanchored regex)
+            proposal["note"] = "matching index exists but is not selective for this predicate"
+
+    return {
+        "name": spec["name"],
+        "collection": spec["collection"],
+        "stages": stages,
+        "issues": issues,
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "returned": stats.get("nReturned"),
+        "time_ms": stats.get("executionTimeMillis"),
+        "proposal": proposal,
+    }
+
+
+def find_redundant_indexes(existing_indexes):
+    """Plain indexes whose keys are a strict prefix of another index on the same collection"""
+    redundant = []
+    for name, index in existing_indexes.items():
+        if name == "_id_" or index.get("unique") or index.get("partialFilterExpression") or index.get("sparse"):
+            continue
+        keys = [tuple(key) for key in index["key"]]
+        for other_name, other in existing_indexes.items():
+            other_keys = [tuple(key) for key in other["key"]]
+            if other_name != name and not other.get("partialFilterExpression") \
+                    and len(other_keys) > len(keys) and other_keys[: len(keys)] == keys:
+                redundant.append({"index": name, "covered_by": other_name})
+                break
+    return redundant
+
+
+def run_audit(db, apply=False, drop_redundant=False):
+    samples = sample_values(db)
+    catalog = query_catalog(samples)
+    collections = sorted({spec["collection"] for spec in catalog})
+    indexes = {name: db[name].index_information() for name in collections}
+
+    results = [audit_query(db, spec, indexes[spec["collection"]]) for spec in catalog]
+    redundant = {name: find_redundant_indexes(indexes[name]) for name in collections}
+
+    applied, dropped = [], []
+    if apply:
+        for result in results:
+            proposal = result["proposal"]
+            if proposal and "note" not in proposal:
+                options = {}
+                if "partialFilterExpression" in proposal:
+                    options["partialFilterExpression"] = proposal["partialFilterExpression"]
+                name = db[result["collection"]].create_index(proposal["keys"], **options)
+                applied.append({"collection": result["collection"], "index": name})
+    if drop_redundant:
+        for collection, entries in redundant.items():
+            for entry in entries:
+                db[collection].drop_index(entry["index"])
+                dropped.append({"collection": collection, "index": entry["index"]})
+
+    return {
+        "generated_at": datetime.utcnow().isoformat(),
+        "queries": results,
+        "redundant_indexes": {name: entries for name, entries in redundant.items() if entries},
+        "applied": applied,
+        "dropped": dropped,
+        "summary": {
+            "queries": len(results),
+            "flagged": sum(1 for result in results if result["issues"]),
+            "collscans": sum(1 for result in results if "COLLSCAN" in result["issues"]),
+            "in_memory_sorts": sum(1 for result in results if "IN_MEMORY_SORT" in result["issues"]),
+        },
+    }
+
+
+def write_report(report):
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    path = os.path.join(REPORT_DIR, f"index_advisor_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    return path
+
+
+def print_report(report):
+    print("\n📊 Query plan audit:")
+    for result in report["queries"]:
+        marker = "⚠️ " if result["issues"] else "✅"
+        print(f"{marker} {result['name']:<28} {' > '.join(result['stages']):<40} "
+              f"docs={result['docs_examined']} keys={result['keys_examined']} ms={result['time_ms']}")
+        if result["proposal"]:
+            print(f"     💡 propose {result['proposal']}")
+    for collection, entries in report["redundant_indexes"].items():
+        for entry in entries:
+            print(f"🗑️ {collection}.{entry['index']} is redundant with {entry['covered_by']}")
+    for entry in report["applied"]:
+        print(f"✅ Created {entry['collection']}.{entry['index']}")
+    for entry in report["dropped"]:
+        print(f"✅ Dropped {entry['collection']}.{entry['index']}")
+    summary = report["summary"]
+    print(f"\n{summary['flagged']}/{summary['queries']} queries flagged "
+          f"({summary['collscans']} COLLSCAN, {summary['in_memory_sorts']} in-memory sort)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="Create the proposed indexes")
+    parser.add_argument("--drop-redundant", action="store_true", help="Drop indexes covered by a longer compound index")
+    args = parser.parse_args()
+
+    report = run_audit(get_database(), apply=args.apply, drop_redundant=args.drop_redundant)
+    print_report(report)
+    print(f"\n📝 Report written to {write_report(report)}")
@@ -0,0 +1,23 @@
+"""Keep inventory_counters in sync with inventory_items.
+
+Tails a change stream on replica sets and falls back to periodic rebuilds on a
+standalone mongod. Run one instance alongside the API workers.
+"""
+import time
+from dotenv import load_dotenv
+from models.database import get_database
+from services.inventory_counters import InventoryCounterWorker
+
+load_dotenv()
+
+
+if __name__ == "__main__":
+    worker = InventoryCounterWorker(get_database()).start()
+    print("🔄 Inventory counter worker started")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"🔄 Inventory counter worker running ({worker.mode})")
+    except KeyboardInterrupt:
+        worker.stop()
+        print("👋 Inventory counter worker stopped")
@@ -3,6 +3,9 @@ import os
 from pymongo import MongoClient
 from datetime import datetime
 import json
+from services.inventory_counters import rebuild_inventory_counters
+from services.scheduler import run_job
+from models.catalog import catalog_jobs
 
 
 def get_mongodb_client():
@@ -66,6 +69,10 @@ def load_data_to_mongodb():
 
     for order in orders_data:
         order["_id"] = order["order_id"]  # Use order_id as MongoDB _id
+        # Drop empty timestamps (NaN from pandas) so "not shipped yet" reads as missing
+        for field in ("shipped_at", "delivered_at", "returned_at"):
+            if pd.isna(order.get(field)):
+                order.pop(field, None)
 
     db.orders.insert_many(orders_data)
     print(f"✅ Loaded {len(orders_data)} orders")
@@ -77,6 +84,10 @@ def load_data_to_mongodb():
 
     for item in order_items_data:
         item["_id"] = item["id"]  # Use original ID as MongoDB _id
+        # Same as orders: unset timestamps are missing, not NaN
+        for field in ("shipped_at", "delivered_at", "returned_at"):
+            if pd.isna(item.get(field)):
+                item.pop(field, None)
 
     db.order_items.insert_many(order_items_data)
     print(f"✅ Loaded {len(order_items_data)} order items")
@@ -119,6 +130,9 @@ def load_data_to_mongodb():
         item["product_distribution_center_id"] = int(
             item["product_distribution_center_id"]
         )
+        # Unsold items have no sold_at; pandas reads the empty cell as NaN
+        if pd.isna(item.get("sold_at")):
+            item.pop("sold_at", None)
 
     db.inventory_items.insert_many(inventory_data)
     print(f"✅ Loaded {len(inventory_data)} inventory items (sampled)")
@@ -127,14 +141,23 @@ def load_data_to_mongodb():
     print("🔍 Creating indexes...")
 
     # Indexes for inventory items
-    db.inventory_items.create_index("product_name")
+    # (product_name, sold_at) also serves product_name-only lookups
     db.inventory_items.create_index("product_category")
-    db.inventory_items.create_index("sold_at")
     db.inventory_items.create_index([("product_name", 1), ("sold_at", 1)])
+    # Top sellers only ever scan sold items
+    db.inventory_items.create_index(
+        "sold_at", partialFilterExpression={"sold_at": {"$exists": True}}
+    )
+    # Vector-index product search matches inventory by product_id
+    db.inventory_items.create_index("product_id")
 
     # Indexes for orders
     db.orders.create_index("order_id")
     db.orders.create_index("status")
+    db.orders.create_index([("user_id", 1), ("created_at", -1)])
+
+    # Line items are joined onto orders by order_id
+    db.order_items.create_index("order_id")
 
     # Indexes for products
     db.products.create_index("product_id")
@@ -145,6 +168,17 @@ def load_data_to_mongodb():
 
     print("✅ Indexes created successfully!")
 
+    # Precompute per-product stock counters (kept current by inventory_worker.py)
+    print("🔢 Building inventory counters...")
+    rebuild_inventory_counters(db)
+    print("✅ Inventory counters built")
+
+    # Replace precomputed answers from the previous data set instead of waiting for the scheduler
+    print("🔥 Warming precomputed results...")
+    for job in catalog_jobs():
+        run_job(db, job)
+    print("✅ Precomputed results warmed")
+
     # Print database statistics
     print("\n📊 Database Statistics:")
     print(f"Products: {db.products.count_documents({}):,}")
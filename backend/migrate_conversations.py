@@ -1,14 +1,30 @@
+import sys
 from models.conversation import ConversationManager
+from models.database import get_database
+from models.schema import apply_schema, SCHEMA_VERSION, SCHEMA_ID
+
+
+def migrate():
+    """Create conversation collections and indexes; safe to run on every deploy"""
+    db = get_database()
+    record = db.schema_version.find_one({"_id": SCHEMA_ID}) or {}
+    current = record.get("version", 0)
+
+    print(f"Conversation schema: version {current} -> {SCHEMA_VERSION}")
+    apply_schema(db)
+    print("✅ Conversation collections and indexes up to date")
+
+    if current < 3:
+        # Version 3 introduced incrementally maintained user_stats; backfill it once
+        count = ConversationManager(db).reconcile_user_stats()
+        print(f"✅ Backfilled statistics for {count} users")
+
 
 def setup_conversation_schema():
     """Setup conversation schema in MongoDB"""
+    migrate()
     manager = ConversationManager()
     
-    print("Setting up conversation schema...")
-    
-    # The indexes are created in the ConversationManager constructor
-    print("✅ Conversation collections and indexes created")
-    
     # Create some sample data for testing
     print("\nCreating sample conversation data...")
     
@@ -58,4 +74,7 @@ def setup_conversation_schema():
     print("\n✅ Conversation schema setup complete!")
 
 if __name__ == "__main__":
-    setup_conversation_schema()
\ No newline at end of file
+    if "--sample-data" in sys.argv:
+        setup_conversation_schema()
+    else:
+        migrate()
\ No newline at end of file
@@ -0,0 +1,180 @@
+import os
+import zlib
+from datetime import datetime, timedelta
+import bson
+from bson import Binary
+from pymongo import ReplaceOne
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 30))
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", 500))
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", 1000))
+# A claimed deletion not finished within this window is picked up again by another worker
+DELETION_LEASE = timedelta(minutes=5)
+
+
+def _pack(messages):
+    return Binary(zlib.compress(bson.encode({"messages": messages}), 6))
+
+
+def _unpack(data):
+    return bson.decode(zlib.decompress(data))["messages"]
+
+
+def _preview(message):
+    content = message["content"]
+    return {
+        "type": message["type"],
+        "content": content[:100] + "..." if len(content) > 100 else content,
+        "timestamp": message["timestamp"],
+    }
+
+
+class ConversationArchiver:
+    """Moves idle conversations' messages into compressed chunks
+
+    Archived messages live in archived_messages as zlib-compressed BSON chunks of up
+    to ARCHIVE_CHUNK_SIZE messages, numbered per conversation. A conversation with
+    archived_at set has its oldest archived_message_count messages (up to
+    archived_until) in its first archived_chunks chunks and any newer ones still
+    in messages; readers merge the two. Replies go to messages as usual and are
+    archived by a later pass.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def archive_idle(self, idle_days=ARCHIVE_AFTER_DAYS, limit=None):
+        """Archive every conversation idle for longer than idle_days; returns how many were archived"""
+        cutoff = datetime.utcnow() - timedelta(days=idle_days)
+        cursor = self.db.conversations.find(
+            {
+                "last_activity": {"$lt": cutoff},
+                # Never archived, or active again after the last pass
+                "$or": [{"archived_at": {"$exists": False}}, {"$expr": {"$gt": ["$last_activity", "$archived_at"]}}],
+            },
+            {"_id": 1},
+        )
+        if limit:
+            cursor = cursor.limit(limit)
+
+        archived = 0
+        for conversation in cursor:
+            if self.archive_conversation(conversation["_id"], cutoff):
+                archived += 1
+        return archived
+
+    def archive_conversation(self, conv_id, cutoff):
+        """Compress one idle conversation's live messages into the cold store, then drop them from messages
+
+        Returns False without archiving anything if the conversation saw activity
+        after cutoff by the time the archive is committed.
+        """
+        conversation = self.db.conversations.find_one({"_id": conv_id}, {"archived_chunks": 1})
+        if conversation is None:
+            return False
+        first_chunk = conversation.get("archived_chunks", 0)
+        messages = list(self.db.messages.find({"conversation_id": conv_id}).sort("timestamp", 1))
+        if not messages:
+            return False
+
+        # Chunk numbers continue from the committed ones, so a re-run after a crash overwrites its own leftovers
+        chunks = [messages[i:i + ARCHIVE_CHUNK_SIZE] for i in range(0, len(messages), ARCHIVE_CHUNK_SIZE)]
+        self.db.archived_messages.bulk_write([
+            ReplaceOne(
+                {"_id": f"{conv_id}:{first_chunk + index}"},
+                {
+                    "conversation_id": conv_id,
+                    "chunk": first_chunk + index,
+                    "count": len(chunk),
+                    "first_timestamp": chunk[0]["timestamp"],
+                    "last_timestamp": chunk[-1]["timestamp"],
+                    "data": _pack(chunk),
+                },
+                upsert=True,
+            )
+            for index, chunk in enumerate(chunks)
+        ])
+
+        # Commit only if no reply arrived meanwhile (add_message bumps last_activity) and no other pass won
+        result = self.db.conversations.update_one(
+            {"_id": conv_id, "last_activity": {"$lt": cutoff}, "archived_chunks": conversation.get("archived_chunks")},
+            {
+                "$set": {
+                    "archived_at": datetime.utcnow(),
+                    "archived_chunks": first_chunk + len(chunks),
+                    "archived_until": messages[-1]["timestamp"],
+                    "archived_last_message": _preview(messages[-1]),
+                },
+                "$inc": {"archived_message_count": len(messages)},
+            },
+        )
+        if result.modified_count == 0:
+            self.db.archived_messages.delete_many({"conversation_id": conv_id, "chunk": {"$gte": first_chunk}})
+            return False
+
+        for i in range(0, len(messages), DELETE_BATCH_SIZE):
+            ids = [message["_id"] for message in messages[i:i + DELETE_BATCH_SIZE]]
+            self.db.messages.delete_many({"_id": {"$in": ids}})
+        return True
+
+    def read_archived(self, conversation, skip=0, limit=None):
+        """A page of a conversation's archived messages, decompressing only the chunks it spans"""
+        end = skip + limit if limit else None
+        selected, first_offset, offset = [], None, 0
+        chunks = self.db.archived_messages.find(
+            {"conversation_id": conversation["_id"], "chunk": {"$lt": conversation.get("archived_chunks", 0)}},
+            {"count": 1},
+        ).sort("chunk", 1)
+        for chunk in chunks:
+            if end is not None and offset >= end:
+                break
+            if offset + chunk["count"] > skip:
+                if first_offset is None:
+                    first_offset = offset
+                selected.append(chunk["_id"])
+            offset += chunk["count"]
+        if not selected:
+            return []
+
+        messages = []
+        for chunk in self.db.archived_messages.find({"_id": {"$in": selected}}).sort("chunk", 1):
+            messages.extend(_unpack(chunk["data"]))
+        start = skip - first_offset
+        return messages[start:start + limit] if limit else messages[start:]
+
+    def enqueue_deletion(self, conv_id):
+        """Schedule a conversation's messages (hot and archived) for batched background deletion"""
+        self.db.deletion_queue.update_one(
+            {"_id": conv_id},
+            {"$setOnInsert": {"enqueued_at": datetime.utcnow(), "claimed_at": None}},
+            upsert=True,
+        )
+
+    def process_deletions(self, max_jobs=None):
+        """Drain the deletion queue in DELETE_BATCH_SIZE batches; returns messages deleted"""
+        deleted = 0
+        jobs = 0
+        while max_jobs is None or jobs < max_jobs:
+            now = datetime.utcnow()
+            job = self.db.deletion_queue.find_one_and_update(
+                {"$or": [{"claimed_at": None}, {"claimed_at": {"$lt": now - DELETION_LEASE}}]},
+                {"$set": {"claimed_at": now}},
+                sort=[("enqueued_at", 1)],
+            )
+            if job is None:
+                break
+
+            conv_id = job["_id"]
+            while True:
+                ids = [
+                    message["_id"]
+                    for message in self.db.messages.find({"conversation_id": conv_id}, {"_id": 1}).limit(DELETE_BATCH_SIZE)
+                ]
+                if not ids:
+                    break
+                deleted += self.db.messages.delete_many({"_id": {"$in": ids}}).deleted_count
+
+            self.db.archived_messages.delete_many({"conversation_id": conv_id})
+            self.db.deletion_queue.delete_one({"_id": conv_id})
+            jobs += 1
+        return deleted
@@ -0,0 +1,431 @@
+from services.inventory_counters import InventoryCounters, UNSOLD
+from services.order_lookup import OrderLookup
+from services.precompute import PRECOMPUTE_INTERVAL, PRODUCT_CHUNK_SIZE, PrecomputedResults
+from services.product_index import get_product_index
+from services.scheduler import Job
+from services.stock_matrix import get_stock_matrix
+from services.template_responder import extract_search_terms
+
+CATALOG_COLLECTIONS = ["products", "orders", "order_items", "users", "inventory_items", "distribution_centers"]
+
+# Output shape built server-side so rows go straight from the cursor to the encoder
+PRODUCT_COUNTER_PROJECTION = {
+    "_id": 0,
+    "name": "$product_name",
+    "brand": "$product_brand",
+    "category": "$product_category",
+    "price": "$product_retail_price",
+    "total_items": 1,
+    "available_stock": 1,
+}
+
+ORDER_PROJECTION = {
+    "_id": 0,
+    "id": "$order_id",
+    "user_id": 1,
+    "status": 1,
+    "gender": 1,
+    "num_of_item": 1,
+    "created_at": 1,
+    "shipped_at": 1,
+    "delivered_at": 1,
+}
+
+
+def nearby_content(results):
+    """Shape StockMatrix.nearby results like the other aggregation results"""
+    return [
+        {
+            "_id": {
+                "product_name": result["product"]["product_name"],
+                "product_brand": result["product"]["product_brand"],
+                "product_retail_price": result["product"]["product_retail_price"],
+            },
+            "center": result["center"],
+            "distance_km": result["distance_km"],
+            "stock_count": result["stock_count"],
+        }
+        for result in results
+    ]
+
+
+class MongoCatalog:
+    """Catalog queries (products, stock, orders, users) against the collections loaded by load_data.py
+
+    Every *_data method returns a data context: {"type", "content", ...} as consumed
+    by ChatbotService and the prompt serializer. InMemoryCatalog returns the same shapes.
+    """
+
+    name = "mongo"
+
+    def __init__(self, collections):
+        self.collections = collections
+
+    @classmethod
+    def for_database(cls, db):
+        return cls({name: db[name] for name in CATALOG_COLLECTIONS})
+
+    @property
+    def db(self):
+        return self.collections["inventory_items"].database
+
+    @property
+    def precomputed(self):
+        return PrecomputedResults(self.db)
+
+    def _product_query(self, search_query):
+        """Inventory query spec for product search"""
+        # Similarity search over name, brand and category; substring regex until the index is available
+        index = get_product_index(self.db)
+        product_ids = index.search_products(search_query) if index else []
+        if product_ids:
+            match = {"product_id": {"$in": product_ids}}
+        else:
+            match = {"product_name": {"$regex": search_query, "$options": "i"}}
+
+        return {
+            "type": "products",
+            "rank": product_ids,
+            "match": match,
+            "stages": [
+                {
+                    "$group": {
+                        "_id": {
+                            "product_id": "$product_id",
+                            "product_name": "$product_name",
+                            "product_brand": "$product_brand",
+                            "product_retail_price": "$product_retail_price",
+                            "product_category": "$product_category",
+                        },
+                        "total_items": {"$sum": 1},
+                        "available_stock": {"$sum": {"$cond": [UNSOLD, 1, 0]}},
+                    }
+                },
+                {"$limit": 5},
+            ],
+        }
+
+    def _stock_query(self, product_name):
+        """Inventory query spec for unsold stock of a product"""
+        return {
+            "type": "stock",
+            "search_term": product_name,
+            "match": {
+                "product_name": {"$regex": product_name, "$options": "i"},
+                "sold_at": {"$exists": False},
+            },
+            "stages": [
+                {
+                    "$group": {
+                        "_id": {
+                            "product_name": "$product_name",
+                            "product_brand": "$product_brand",
+                            "product_retail_price": "$product_retail_price",
+                        },
+                        "stock_count": {"$sum": 1},
+                    }
+                },
+                {"$limit": 3},
+            ],
+        }
+
+    def _top_products_query(self, search_term=None):
+        """Inventory query spec for top selling products, optionally within a name/category term"""
+        match = {"sold_at": {"$exists": True, "$ne": None}}
+        # LLM terms often echo "top selling products"; keep only the words that narrow the list
+        search_term = " ".join(extract_search_terms(search_term or ""))
+        if search_term:
+            match["$or"] = [
+                {"product_category": {"$regex": search_term, "$options": "i"}},
+                {"product_name": {"$regex": search_term, "$options": "i"}},
+            ]
+        return {
+            "type": "top_products",
+            "match": match,
+            "stages": [
+                {
+                    "$group": {
+                        "_id": {
+                            "product_name": "$product_name",
+                            "product_brand": "$product_brand",
+                            "product_retail_price": "$product_retail_price",
+                        },
+                        "sold_count": {"$sum": 1},
+                    }
+                },
+                {"$sort": {"sold_count": -1}},
+                {"$limit": 5},
+            ],
+        }
+
+    def _category_query(self, category):
+        """Inventory query spec for browsing a category"""
+        # "coats" -> "Outerwear & Coats"; an exact match also uses the product_category index
+        index = get_product_index(self.db)
+        resolved = index.best_category(category) if index else None
+        return {
+            "type": "category",
+            "category": resolved or category,
+            "match": {"product_category": resolved} if resolved else {"product_category": {"$regex": category, "$options": "i"}},
+            "stages": [
+                {
+                    "$group": {
+                        "_id": {
+                            "product_name": "$product_name",
+                            "product_brand": "$product_brand",
+                            "product_retail_price": "$product_retail_price",
+                        },
+                        "available_stock": {"$sum": {"$cond": [UNSOLD, 1, 0]}},
+                    }
+                },
+                {"$limit": 10},
+            ],
+        }
+
+    def _query_spec(self, kind, term):
+        return {
+            "products": self._product_query,
+            "stock": self._stock_query,
+            "top_products": self._top_products_query,
+            "category": self._category_query,
+        }[kind](term)
+
+    def _run_inventory_query(self, spec):
+        """Run one inventory query spec and wrap the result as a data context"""
+        pipeline = [{"$match": spec["match"]}] + spec["stages"]
+        content = list(self.collections["inventory_items"].aggregate(pipeline))
+        return self._data_context_from_spec(spec, content)
+
+    def _data_context_from_spec(self, spec, content):
+        context = {key: value for key, value in spec.items() if key not in ("match", "stages", "rank")}
+        if spec.get("rank"):
+            # $group loses the similarity order; restore it from the ranked product ids
+            position = {product_id: i for i, product_id in enumerate(spec["rank"])}
+            content.sort(key=lambda item: position.get(item["_id"].get("product_id"), len(position)))
+        context["content"] = content
+        return context
+
+    def product_data(self, search_query):
+        return self._run_inventory_query(self._product_query(search_query))
+
+    def stock_data(self, product_name):
+        # Maintained by the inventory counter worker; fall back to counting items if it never ran
+        counters = InventoryCounters(self.db)
+        if counters.is_ready():
+            stock_data = counters.search_in_stock(product_name, limit=3)
+            return {"type": "stock", "content": stock_data, "search_term": product_name}
+
+        return self._run_inventory_query(self._stock_query(product_name))
+
+    def top_products_data(self, search_term=None):
+        spec = self._top_products_query(search_term)
+        if "$or" not in spec["match"]:
+            # The overall ranking is kept fresh by the top_products job
+            content = self.precomputed.get("top_products")
+            if content is not None:
+                return self._data_context_from_spec(spec, content)
+        return self._run_inventory_query(spec)
+
+    def category_data(self, category):
+        spec = self._category_query(category)
+        if isinstance(spec["match"]["product_category"], str):
+            content = self.precomputed.get(f"category:{spec['category']}")
+            if content is not None:
+                return self._data_context_from_spec(spec, content)
+        return self._run_inventory_query(spec)
+
+    def inventory_batch(self, requests):
+        """Answer several (kind, term) requests with one $facet aggregation over inventory_items"""
+        specs = [self._query_spec(kind, term) for kind, term in requests]
+        if not specs:
+            return []
+        # The leading $or lets the planner use each branch's index before the facets split the stream
+        pipeline = [
+            {"$match": {"$or": [spec["match"] for spec in specs]}},
+            {
+                "$facet": {
+                    f"intent_{i}": [{"$match": spec["match"]}] + spec["stages"]
+                    for i, spec in enumerate(specs)
+                }
+            },
+        ]
+        facets = next(self.collections["inventory_items"].aggregate(pipeline), {})
+        return [
+            self._data_context_from_spec(spec, facets.get(f"intent_{i}", []))
+            for i, spec in enumerate(specs)
+        ]
+
+    def user_location(self, user_id):
+        """(latitude, longitude) for a user, or None if unknown"""
+        user = self.collections["users"].find_one({"user_id": str(user_id)}, {"latitude": 1, "longitude": 1})
+        if not user or user.get("latitude") is None or user.get("longitude") is None:
+            return None
+        return user["latitude"], user["longitude"]
+
+    def nearby_stock(self, product_name, lat, lon, limit=5):
+        """Closest distribution center with stock for matching products, from the in-memory matrix"""
+        return nearby_content(get_stock_matrix(self.db).nearby(product_name, lat, lon, limit=limit))
+
+    def get_orders(self, order_ids):
+        return OrderLookup(self.collections).get_orders(order_ids)
+
+    def get_recent_orders(self, user_id):
+        return OrderLookup(self.collections).get_recent_orders(user_id)
+
+    def product_rows(self, limit=None, skip=0, batch_size=None):
+        """Grouped product rows; API pages come from the product_rows job's chunks when fresh"""
+        if limit and batch_size is None:
+            first, last = skip // PRODUCT_CHUNK_SIZE, (skip + limit - 1) // PRODUCT_CHUNK_SIZE
+            chunks = self.precomputed.get_many([f"products:{i}" for i in range(first, last + 1)])
+            if chunks is not None:
+                rows = [row for chunk in chunks for row in chunk]
+                start = skip - first * PRODUCT_CHUNK_SIZE
+                return rows[start:start + limit]
+        return self._live_product_rows(limit, skip, batch_size)
+
+    def _live_product_rows(self, limit=None, skip=0, batch_size=None):
+        """Grouped product rows, from the maintained counters when available"""
+        counters = InventoryCounters(self.db)
+        if counters.is_ready():
+            cursor = counters.counters.find({}, PRODUCT_COUNTER_PROJECTION).sort("_id", 1).skip(skip)
+            if limit:
+                cursor = cursor.limit(limit)
+            if batch_size:
+                cursor = cursor.batch_size(batch_size)
+            return cursor
+
+        # Get unique products from inventory
+        pipeline = [
+            {
+                "$group": {
+                    "_id": {
+                        "product_name": "$product_name",
+                        "product_brand": "$product_brand",
+                        "product_category": "$product_category",
+                        "product_retail_price": "$product_retail_price",
+                    },
+                    "total_items": {"$sum": 1},
+                    "available_stock": {
+                        "$sum": {"$cond": [UNSOLD, 1, 0]}
+                    },
+                }
+            },
+            {"$sort": {"_id": 1}},
+            {"$skip": skip},
+        ]
+        if limit:
+            pipeline.append({"$limit": limit})
+        pipeline.append(
+            {
+                "$project": {
+                    "_id": 0,
+                    "name": "$_id.product_name",
+                    "brand": "$_id.product_brand",
+                    "category": "$_id.product_category",
+                    "price": "$_id.product_retail_price",
+                    "total_items": 1,
+                    "available_stock": 1,
+                }
+            }
+        )
+        options = {"allowDiskUse": True}
+        if batch_size:
+            options["batchSize"] = batch_size
+        return self.collections["inventory_items"].aggregate(pipeline, **options)
+
+    def precompute_top_products(self):
+        spec = self._top_products_query()
+        content = list(self.collections["inventory_items"].aggregate([{"$match": spec["match"]}] + spec["stages"]))
+        return self.precomputed.put_many("top_products", {"top_products": content})
+
+    def precompute_category_listings(self):
+        """Every category's listing (as category_data returns it) in one pass over inventory_items"""
+        pipeline = [
+            {
+                "$group": {
+                    "_id": {
+                        "category": "$product_category",
+                        "product_name": "$product_name",
+                        "product_brand": "$product_brand",
+                        "product_retail_price": "$product_retail_price",
+                    },
+                    "available_stock": {"$sum": {"$cond": [UNSOLD, 1, 0]}},
+                }
+            },
+            {
+                "$group": {
+                    "_id": "$_id.category",
+                    "content": {
+                        "$push": {
+                            "_id": {
+                                "product_name": "$_id.product_name",
+                                "product_brand": "$_id.product_brand",
+                                "product_retail_price": "$_id.product_retail_price",
+                            },
+                            "available_stock": "$available_stock",
+                        }
+                    },
+                }
+            },
+            {"$project": {"content": {"$slice": ["$content", 10]}}},
+        ]
+        listings = {
+            f"category:{listing['_id']}": listing["content"]
+            for listing in self.collections["inventory_items"].aggregate(pipeline, allowDiskUse=True)
+            if listing["_id"]
+        }
+        return self.precomputed.put_many("category_listings", listings)
+
+    def precompute_product_rows(self):
+        chunks = {}
+        chunk = []
+        for row in self._live_product_rows(batch_size=PRODUCT_CHUNK_SIZE):
+            chunk.append(row)
+            if len(chunk) == PRODUCT_CHUNK_SIZE:
+                chunks[f"products:{len(chunks)}"] = chunk
+                chunk = []
+        if chunk or not chunks:
+            chunks[f"products:{len(chunks)}"] = chunk
+        return self.precomputed.put_many("product_rows", chunks)
+
+    def order_rows(self, after=None, limit=None, batch_size=None):
+        """Orders in _id order; `after` is the last id of the previous page (keyset pagination)"""
+        query = {"_id": {"$gt": after}} if after is not None else {}
+        cursor = self.collections["orders"].find(query, ORDER_PROJECTION).sort("_id", 1)
+        if limit:
+            cursor = cursor.limit(limit)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        return cursor
+
+    def data_version(self, name):
+        """Cheap fingerprint of a dataset, used as the ETag for streamed exports; None if there is none"""
+        db = self.db
+        if name == "products":
+            state = db.worker_state.find_one({"_id": "inventory_counters"}) or {}
+            # Without a counters rebuild there is no change marker (e.g. no worker running),
+            # so an ETag would outlive edits to the products
+            if not state.get("rebuilt_at"):
+                return None
+            return f"{state['rebuilt_at']}-{state.get('last_event_at')}-{db.inventory_items.estimated_document_count()}"
+        # Orders change in place (status, shipped_at) with no change marker to key on,
+        # and count/max id miss those updates, so the orders export isn't cached
+        return None
+
+    def ping(self):
+        self.db.client.admin.command("ping")
+
+
+def catalog_jobs():
+    """Scheduler jobs that precompute the expensive, rarely changing catalog answers"""
+    return [
+        Job("top_products", PRECOMPUTE_INTERVAL, lambda db: MongoCatalog.for_database(db).precompute_top_products()),
+        Job("category_listings", PRECOMPUTE_INTERVAL, lambda db: MongoCatalog.for_database(db).precompute_category_listings()),
+        Job("product_rows", PRECOMPUTE_INTERVAL, lambda db: MongoCatalog.for_database(db).precompute_product_rows()),
+    ]
+
+
+def warm_process_caches(db):
+    """Build this worker's in-memory structures before the first request needs them"""
+    get_product_index(db)
+    get_stock_matrix(db)
@@ -1,36 +1,26 @@
 from datetime import datetime
-from pymongo import MongoClient, ASCENDING
 from bson import ObjectId
-import os
+from pymongo import ReturnDocument
+from models.archive import ConversationArchiver
+from models.database import get_database
+from models.schema import check_schema_version
 
 
 class ConversationManager:
-    def __init__(self):
-        mongodb_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
-        self.client = MongoClient(mongodb_uri)
-        self.db = self.client["ecommerce"]
-        self._setup_collections()
-
-    def _setup_collections(self):
-        """Setup conversation collections with indexes"""
-        # Conversations collection
-        if "conversations" not in self.db.list_collection_names():
-            self.db.create_collection("conversations")
-
-        # Messages collection
-        if "messages" not in self.db.list_collection_names():
-            self.db.create_collection("messages")
-
-        # Create indexes for better performance
-        self.db.conversations.create_index([("user_id", ASCENDING)])
-        self.db.conversations.create_index([("created_at", ASCENDING)])
-        self.db.conversations.create_index([("last_activity", ASCENDING)])
-
-        self.db.messages.create_index([("conversation_id", ASCENDING)])
-        self.db.messages.create_index([("timestamp", ASCENDING)])
-        self.db.messages.create_index(
-            [("conversation_id", ASCENDING), ("timestamp", ASCENDING)]
-        )
+    def __init__(self, db=None):
+        # Connection and schema check are deferred to first use so importing the app stays cheap
+        self._db = db
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = get_database()
+            check_schema_version(self._db)
+        return self._db
+
+    @property
+    def archiver(self):
+        return ConversationArchiver(self.db)
 
     def create_conversation(self, user_id, title=None):
         """Create a new conversation session"""
@@ -46,6 +36,16 @@ class ConversationManager:
 
         result = self.db.conversations.insert_one(conversation)
         conversation["_id"] = result.inserted_id
+
+        self.db.user_stats.update_one(
+            {"_id": conversation["user_id"]},
+            {
+                "$inc": {"total_conversations": 1},
+                "$min": {"first_conversation": conversation["created_at"]},
+                "$max": {"last_conversation": conversation["created_at"]},
+            },
+            upsert=True,
+        )
         return conversation
 
     def add_message(self, conversation_id, message_type, content, metadata=None):
@@ -66,7 +66,7 @@ class ConversationManager:
         result = self.db.messages.insert_one(message)
 
         # Update conversation last activity and message count
-        self.db.conversations.update_one(
+        conversation = self.db.conversations.find_one_and_update(
             {
                 "_id": (
                     ObjectId(conversation_id)
@@ -78,7 +78,13 @@ class ConversationManager:
                 "$set": {"last_activity": datetime.utcnow()},
                 "$inc": {"message_count": 1},
             },
+            projection={"user_id": 1},
         )
+        if conversation:
+            self.db.user_stats.update_one(
+                {"_id": conversation["user_id"]},
+                {"$inc": {"total_messages": 1}},
+            )
 
         message["_id"] = result.inserted_id
         return message
@@ -110,7 +116,10 @@ class ConversationManager:
             last_message = self.db.messages.find_one(
                 {"conversation_id": conv["_id"]}, sort=[("timestamp", -1)]
             )
-            if last_message:
+            if not last_message and conv.get("archived_at"):
+                # Preview stored at archive time, so listing never touches the cold store
+                conv["last_message"] = conv["archived_last_message"]
+            elif last_message:
                 conv["last_message"] = {
                     "type": last_message["type"],
                     "content": (
@@ -124,21 +133,28 @@ class ConversationManager:
         return conversations
 
     def get_conversation_messages(self, conversation_id, limit=50, skip=0):
-        """Get messages for a conversation"""
-        messages = list(
-            self.db.messages.find(
-                {
-                    "conversation_id": (
-                        ObjectId(conversation_id)
-                        if isinstance(conversation_id, str)
-                        else conversation_id
-                    )
-                }
-            )
-            .sort("timestamp", 1)
-            .skip(skip)
-            .limit(limit)
+        """Get messages for a conversation, older archived ones first"""
+        conv_id = (
+            ObjectId(conversation_id)
+            if isinstance(conversation_id, str)
+            else conversation_id
+        )
+        archived = self.db.conversations.find_one(
+            {"_id": conv_id, "archived_at": {"$exists": True}},
+            {"archived_chunks": 1, "archived_message_count": 1, "archived_until": 1},
         )
+        if not archived:
+            query = self.db.messages.find({"conversation_id": conv_id}).sort("timestamp", 1)
+            return list(query.skip(skip).limit(limit))
+
+        archived_count = archived.get("archived_message_count", 0)
+        messages = self.archiver.read_archived(archived, skip, limit) if skip < archived_count else []
+        if len(messages) < limit:
+            # Newer than the archive, which also skips copies the archiver hasn't deleted yet
+            live = self.db.messages.find(
+                {"conversation_id": conv_id, "timestamp": {"$gt": archived["archived_until"]}}
+            ).sort("timestamp", 1)
+            messages += list(live.skip(max(0, skip - archived_count)).limit(limit - len(messages)))
         return messages
 
     def delete_conversation(self, conversation_id):
@@ -149,36 +165,94 @@ class ConversationManager:
             else conversation_id
         )
 
-        # Delete all messages
-        self.db.messages.delete_many({"conversation_id": conv_id})
-
         # Delete conversation
-        result = self.db.conversations.delete_one({"_id": conv_id})
-        return result.deleted_count > 0
+        conversation = self.db.conversations.find_one_and_delete(
+            {"_id": conv_id},
+            projection={"user_id": 1, "message_count": 1, "created_at": 1},
+        )
+        if not conversation:
+            return False
+
+        # Messages (hot and archived) are removed in batches by archive_worker.py
+        self.archiver.enqueue_deletion(conv_id)
+
+        stats = self.db.user_stats.find_one_and_update(
+            {"_id": conversation["user_id"]},
+            {
+                "$inc": {
+                    "total_conversations": -1,
+                    "total_messages": -conversation.get("message_count", 0),
+                }
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+        # $min/$max can't be undone incrementally; recompute if we removed an endpoint
+        if stats and conversation.get("created_at") in (
+            stats.get("first_conversation"),
+            stats.get("last_conversation"),
+        ):
+            self.reconcile_user_stats(conversation["user_id"])
+        return True
 
     def get_conversation_statistics(self, user_id):
         """Get statistics for a user's conversations"""
+        stats = self.db.user_stats.find_one({"_id": str(user_id)})
+        if stats is None:
+            # Users created before incremental stats existed get backfilled on first read
+            stats = self.reconcile_user_stats(user_id)
+
+        total_conversations = stats.get("total_conversations", 0) if stats else 0
+        total_messages = stats.get("total_messages", 0) if stats else 0
+        if not total_conversations:
+            return {
+                "total_conversations": 0,
+                "total_messages": 0,
+                "avg_messages_per_conversation": 0,
+            }
+
+        return {
+            "total_conversations": total_conversations,
+            "total_messages": total_messages,
+            "avg_messages_per_conversation": total_messages / total_conversations,
+            "first_conversation": stats.get("first_conversation"),
+            "last_conversation": stats.get("last_conversation"),
+        }
+
+    def reconcile_user_stats(self, user_id=None):
+        """Recompute user_stats from the conversations collection to repair drift
+
+        With a user_id, recomputes and returns that user's document; without one,
+        recomputes every user and returns the number of documents written.
+        """
+        match = {"user_id": str(user_id)} if user_id is not None else {}
         pipeline = [
-            {"$match": {"user_id": str(user_id)}},
+            {"$match": match},
             {
                 "$group": {
-                    "_id": None,
+                    "_id": "$user_id",
                     "total_conversations": {"$sum": 1},
                     "total_messages": {"$sum": "$message_count"},
-                    "avg_messages_per_conversation": {"$avg": "$message_count"},
                     "first_conversation": {"$min": "$created_at"},
                     "last_conversation": {"$max": "$created_at"},
                 }
             },
         ]
 
-        result = list(self.db.conversations.aggregate(pipeline))
-        return (
-            result[0]
-            if result
-            else {
-                "total_conversations": 0,
-                "total_messages": 0,
-                "avg_messages_per_conversation": 0,
-            }
-        )
+        reconciled_at = datetime.utcnow()
+        results = list(self.db.conversations.aggregate(pipeline))
+        for stats in results:
+            self.db.user_stats.replace_one(
+                {"_id": stats["_id"]},
+                {**stats, "reconciled_at": reconciled_at},
+                upsert=True,
+            )
+
+        if user_id is not None:
+            if not results:
+                self.db.user_stats.delete_one({"_id": str(user_id)})
+                return None
+            return results[0]
+
+        # Drop stats for users whose conversations are all gone
+        self.db.user_stats.delete_many({"reconciled_at": {"$lt": reconciled_at}})
+        return len(results)
@@ -0,0 +1,24 @@
+import os
+import threading
+from pymongo import MongoClient
+from services.profiling import command_timer
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_mongodb_client():
+    """Process-wide MongoDB client, created on first use without blocking on a connection"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                mongodb_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+                # connect=False defers the connection to the first operation
+                _client = MongoClient(mongodb_uri, connect=False, event_listeners=[command_timer])
+    return _client
+
+
+def get_database():
+    """Get ecommerce database"""
+    return get_mongodb_client()["ecommerce"]
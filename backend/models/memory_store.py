@@ -0,0 +1,415 @@
+import bisect
+import copy
+import math
+import os
+import re
+import threading
+from datetime import datetime
+import numpy as np
+from bson import ObjectId
+from models.catalog import nearby_content
+from services.inventory_counters import PRODUCT_FIELDS
+from services.order_lookup import ITEM_FIELDS, RECENT_ORDERS_LIMIT, numeric_order_ids
+from services.product_index import VectorIndex, PRODUCT_FIELDS as INDEX_FIELDS, CATEGORY_FIELDS, MIN_CATEGORY_SCORE
+from services.stock_matrix import haversine_km
+from services.template_responder import extract_search_terms
+
+# Group keys the stock, top-seller and category aggregations return
+GROUP_FIELDS = ["product_name", "product_brand", "product_retail_price"]
+ORDER_ITEM_FIELDS = [field for field, included in ITEM_FIELDS.items() if included]
+ORDER_ROW_FIELDS = ["user_id", "status", "gender", "num_of_item", "created_at", "shipped_at", "delivered_at"]
+
+
+def _object_id(value):
+    return ObjectId(value) if isinstance(value, str) else value
+
+
+class InMemoryConversationManager:
+    """ConversationManager with the same public methods, held in process memory
+
+    Conversations are indexed by _id and by user; each conversation's messages are
+    kept in a list sorted by timestamp, so history reads are slices. Nothing is
+    persisted: use it for benchmarks, load tests and single-node deployments.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.conversations = {}
+        self.user_conversations = {}
+        self.messages = {}
+        self.message_timestamps = {}
+
+    def create_conversation(self, user_id, title=None):
+        """Create a new conversation session"""
+        now = datetime.utcnow()
+        conversation = {
+            "_id": ObjectId(),
+            "user_id": str(user_id),
+            "title": title or f"Conversation {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+            "created_at": now,
+            "last_activity": now,
+            "message_count": 0,
+            "status": "active",
+        }
+        with self._lock:
+            self.conversations[conversation["_id"]] = conversation
+            self.user_conversations.setdefault(conversation["user_id"], set()).add(conversation["_id"])
+            self.messages[conversation["_id"]] = []
+            self.message_timestamps[conversation["_id"]] = []
+        # Callers mutate what they get back (e.g. stringify _id), so never hand out stored documents
+        return dict(conversation)
+
+    def add_message(self, conversation_id, message_type, content, metadata=None):
+        """Add a message to a conversation"""
+        conv_id = _object_id(conversation_id)
+        message = {
+            "_id": ObjectId(),
+            "conversation_id": conv_id,
+            "type": message_type,
+            "content": content,
+            "timestamp": datetime.utcnow(),
+            "metadata": metadata or {},
+        }
+        with self._lock:
+            conversation = self.conversations.get(conv_id)
+            if conversation is not None:
+                # Timestamps are non-decreasing in practice; bisect keeps the list sorted regardless
+                position = bisect.bisect_right(self.message_timestamps[conv_id], message["timestamp"])
+                self.message_timestamps[conv_id].insert(position, message["timestamp"])
+                self.messages[conv_id].insert(position, message)
+                conversation["last_activity"] = datetime.utcnow()
+                conversation["message_count"] += 1
+        return copy.deepcopy(message)
+
+    def get_conversation(self, conversation_id):
+        """Get a single conversation"""
+        with self._lock:
+            conversation = self.conversations.get(_object_id(conversation_id))
+            return dict(conversation) if conversation else None
+
+    def get_user_conversations(self, user_id, limit=20, skip=0):
+        """Get all conversations for a user"""
+        with self._lock:
+            conversations = [self.conversations[conv_id] for conv_id in self.user_conversations.get(str(user_id), ())]
+            conversations.sort(key=lambda conversation: conversation["last_activity"], reverse=True)
+            page = [dict(conversation) for conversation in conversations[skip:skip + limit]]
+            for conv in page:
+                messages = self.messages[conv["_id"]]
+                if messages:
+                    last_message = messages[-1]
+                    conv["last_message"] = {
+                        "type": last_message["type"],
+                        "content": (
+                            last_message["content"][:100] + "..."
+                            if len(last_message["content"]) > 100
+                            else last_message["content"]
+                        ),
+                        "timestamp": last_message["timestamp"],
+                    }
+        return page
+
+    def get_conversation_messages(self, conversation_id, limit=50, skip=0):
+        """Get messages for a conversation"""
+        with self._lock:
+            messages = self.messages.get(_object_id(conversation_id), [])
+            return copy.deepcopy(messages[skip:skip + limit])
+
+    def delete_conversation(self, conversation_id):
+        """Delete a conversation and all its messages"""
+        conv_id = _object_id(conversation_id)
+        with self._lock:
+            conversation = self.conversations.pop(conv_id, None)
+            if conversation is None:
+                return False
+            self.user_conversations[conversation["user_id"]].discard(conv_id)
+            self.messages.pop(conv_id, None)
+            self.message_timestamps.pop(conv_id, None)
+        return True
+
+    def get_conversation_statistics(self, user_id):
+        """Get statistics for a user's conversations"""
+        with self._lock:
+            conversations = [self.conversations[conv_id] for conv_id in self.user_conversations.get(str(user_id), ())]
+            if not conversations:
+                return {
+                    "total_conversations": 0,
+                    "total_messages": 0,
+                    "avg_messages_per_conversation": 0,
+                }
+            total_messages = sum(conversation["message_count"] for conversation in conversations)
+            created = [conversation["created_at"] for conversation in conversations]
+        return {
+            "total_conversations": len(conversations),
+            "total_messages": total_messages,
+            "avg_messages_per_conversation": total_messages / len(conversations),
+            "first_conversation": min(created),
+            "last_conversation": max(created),
+        }
+
+    def reconcile_user_stats(self, user_id=None):
+        """Statistics are computed on read, so there is nothing to repair"""
+        if user_id is not None:
+            return self.get_conversation_statistics(user_id)
+        return len(self.user_conversations)
+
+
+def _compile(term):
+    """Case-insensitive pattern like the $regex the Mongo catalog sends; literal if it isn't a valid regex"""
+    try:
+        return re.compile(term, re.IGNORECASE)
+    except re.error:
+        return re.compile(re.escape(term), re.IGNORECASE)
+
+
+def _clean(record):
+    """Drop the NaN pandas reads for empty CSV cells, as load_data.py does for sold_at and timestamps"""
+    return {key: value for key, value in record.items() if not (isinstance(value, float) and math.isnan(value))}
+
+
+class InMemoryCatalog:
+    """MongoCatalog's queries answered from indexed dicts instead of a database
+
+    Inventory items are folded into per-product counters at load time (the same
+    documents inventory_counters holds), with a category index, a best-seller
+    ranking, a product x center stock matrix and the vector indexes for search.
+    """
+
+    name = "memory"
+
+    def __init__(self, products=(), inventory_items=(), orders=(), order_items=(), users=(), distribution_centers=()):
+        self.products = {product["_id"]: product for product in products}
+        self.users = {str(user["user_id"]): user for user in users}
+
+        centers = sorted(distribution_centers, key=lambda center: center["id"])
+        self.center_names = [center["name"] for center in centers]
+        self.center_lats = np.array([center["latitude"] for center in centers], dtype=np.float64)
+        self.center_lons = np.array([center["longitude"] for center in centers], dtype=np.float64)
+        center_column = {center["id"]: i for i, center in enumerate(centers)}
+
+        self.counters = {}
+        for item in inventory_items:
+            counter = self.counters.get(item["product_id"])
+            if counter is None:
+                counter = self.counters[item["product_id"]] = {
+                    "_id": item["product_id"],
+                    **{field: item.get(field) for field in PRODUCT_FIELDS},
+                    "total_items": 0,
+                    "available_stock": 0,
+                    "sold_count": 0,
+                    "by_center": np.zeros(len(centers), dtype=np.int32),
+                }
+            counter["total_items"] += 1
+            if item.get("sold_at") is None:
+                counter["available_stock"] += 1
+                column = center_column.get(item.get("product_distribution_center_id"))
+                if column is not None:
+                    counter["by_center"][column] += 1
+            else:
+                counter["sold_count"] += 1
+
+        self.product_ids = sorted(self.counters)
+        self.by_category = {}
+        for product_id in self.product_ids:
+            self.by_category.setdefault(self.counters[product_id].get("product_category"), []).append(product_id)
+        self.best_sellers = sorted(
+            (product_id for product_id in self.product_ids if self.counters[product_id]["sold_count"]),
+            key=lambda product_id: self.counters[product_id]["sold_count"],
+            reverse=True,
+        )
+
+        self.product_index = VectorIndex(INDEX_FIELDS)
+        self.product_index.build(
+            {"_id": product_id, **{field: self.counters[product_id].get(field) for field, _ in INDEX_FIELDS}}
+            for product_id in self.product_ids
+        )
+        self.category_index = VectorIndex(CATEGORY_FIELDS)
+        self.category_index.build(
+            {"_id": category, "product_category": category} for category in self.by_category if category
+        )
+
+        self.orders = {order["order_id"]: order for order in orders}
+        self.order_ids = sorted(self.orders)
+        self.order_items = {}
+        for item in order_items:
+            self.order_items.setdefault(item["order_id"], []).append(item)
+        self.orders_by_user = {}
+        for order in self.orders.values():
+            self.orders_by_user.setdefault(str(order.get("user_id")), []).append(order)
+        for user_orders in self.orders_by_user.values():
+            user_orders.sort(key=lambda order: str(order.get("created_at")), reverse=True)
+
+    @classmethod
+    def from_csv(cls, data_dir="data", inventory_sample=0.1):
+        """Load the same CSVs (and the same inventory sample) as load_data.py"""
+        import pandas as pd
+
+        def records(name):
+            return [_clean(record) for record in pd.read_csv(os.path.join(data_dir, f"{name}.csv")).to_dict("records")]
+
+        products = records("products")
+        for product in products:
+            product["_id"] = product["id"]
+        users = records("users")
+        for user in users:
+            user["user_id"] = str(user["id"])
+        inventory_df = pd.read_csv(os.path.join(data_dir, "inventory_items.csv"))
+        inventory_items = [
+            _clean(record) for record in inventory_df.sample(frac=inventory_sample, random_state=42).to_dict("records")
+        ]
+        for item in inventory_items:
+            item["product_id"] = str(item["product_id"])
+            item["product_distribution_center_id"] = int(item["product_distribution_center_id"])
+
+        return cls(
+            products=products,
+            inventory_items=inventory_items,
+            orders=records("orders"),
+            order_items=records("order_items"),
+            users=users,
+            distribution_centers=records("distribution_centers"),
+        )
+
+    def _group(self, product_id, *fields, **counts):
+        counter = self.counters[product_id]
+        group = {field: counter.get(field) for field in fields}
+        return {"_id": group, **{name: counter[field] for name, field in counts.items()}}
+
+    def product_data(self, search_query):
+        product_ids = [doc["_id"] for doc, _ in self.product_index.search(search_query, k=5)]
+        if not product_ids:
+            pattern = _compile(search_query)
+            product_ids = [
+                product_id for product_id in self.product_ids
+                if pattern.search(self.counters[product_id].get("product_name") or "")
+            ][:5]
+        content = [
+            self._group(product_id, *PRODUCT_FIELDS, total_items="total_items", available_stock="available_stock")
+            for product_id in product_ids
+        ]
+        for product_id, item in zip(product_ids, content):
+            item["_id"]["product_id"] = product_id
+        return {"type": "products", "content": content}
+
+    def stock_data(self, product_name):
+        pattern = _compile(product_name)
+        product_ids = [
+            product_id for product_id in self.product_ids
+            if self.counters[product_id]["available_stock"] and pattern.search(self.counters[product_id].get("product_name") or "")
+        ][:3]
+        content = [self._group(product_id, *GROUP_FIELDS, stock_count="available_stock") for product_id in product_ids]
+        return {"type": "stock", "content": content, "search_term": product_name}
+
+    def top_products_data(self, search_term=None):
+        search_term = " ".join(extract_search_terms(search_term or ""))
+        product_ids = self.best_sellers
+        if search_term:
+            pattern = _compile(search_term)
+            product_ids = [
+                product_id for product_id in product_ids
+                if pattern.search(self.counters[product_id].get("product_category") or "")
+                or pattern.search(self.counters[product_id].get("product_name") or "")
+            ]
+        content = [self._group(product_id, *GROUP_FIELDS, sold_count="sold_count") for product_id in product_ids[:5]]
+        return {"type": "top_products", "content": content}
+
+    def category_data(self, category):
+        matches = self.category_index.search(category, k=1, min_score=MIN_CATEGORY_SCORE)
+        resolved = matches[0][0]["product_category"] if matches else None
+        if resolved:
+            product_ids = self.by_category.get(resolved, [])
+        else:
+            pattern = _compile(category)
+            product_ids = [
+                product_id for name, ids in self.by_category.items() if name and pattern.search(name) for product_id in ids
+            ]
+        content = [self._group(product_id, *GROUP_FIELDS, available_stock="available_stock") for product_id in product_ids[:10]]
+        return {"type": "category", "category": resolved or category, "content": content}
+
+    def inventory_batch(self, requests):
+        handlers = {
+            "products": self.product_data,
+            "stock": self.stock_data,
+            "top_products": self.top_products_data,
+            "category": self.category_data,
+        }
+        return [handlers[kind](term) for kind, term in requests]
+
+    def user_location(self, user_id):
+        user = self.users.get(str(user_id))
+        if not user or user.get("latitude") is None or user.get("longitude") is None:
+            return None
+        return user["latitude"], user["longitude"]
+
+    def nearby_stock(self, product_name, lat, lon, limit=5):
+        words = product_name.lower().split()
+        product_ids = [
+            product_id for product_id in self.product_ids
+            if all(word in (self.counters[product_id].get("product_name") or "").lower() for word in words)
+        ][:limit]
+
+        distances = haversine_km(lat, lon, self.center_lats, self.center_lons)
+        order = np.argsort(distances)
+        results = []
+        for product_id in product_ids:
+            counter = self.counters[product_id]
+            product = {"product_name": counter.get("product_name"), "product_brand": counter.get("product_brand"),
+                       "product_retail_price": counter.get("product_retail_price")}
+            stocked = [column for column in order if counter["by_center"][column] > 0]
+            if not stocked:
+                results.append({"product": product, "center": None, "distance_km": None, "stock_count": 0})
+                continue
+            column = stocked[0]
+            results.append({
+                "product": product,
+                "center": self.center_names[column],
+                "distance_km": round(float(distances[column]), 1),
+                "stock_count": int(counter["by_center"][column]),
+            })
+        return nearby_content(results)
+
+    def _order_details(self, order):
+        order = dict(order)
+        order["items"] = []
+        for item in self.order_items.get(order["order_id"], []):
+            product = self.products.get(item.get("product_id"), {})
+            order["items"].append({
+                **{field: item[field] for field in ORDER_ITEM_FIELDS if field in item},
+                "product_name": product.get("name"),
+                "product_brand": product.get("brand"),
+            })
+        return order
+
+    def get_orders(self, order_ids):
+        return [self._order_details(self.orders[order_id]) for order_id in numeric_order_ids(order_ids) if order_id in self.orders]
+
+    def get_recent_orders(self, user_id):
+        return [self._order_details(order) for order in self.orders_by_user.get(str(user_id), [])[:RECENT_ORDERS_LIMIT]]
+
+    def product_rows(self, limit=None, skip=0, batch_size=None):
+        product_ids = self.product_ids[skip:skip + limit] if limit else self.product_ids[skip:]
+        for product_id in product_ids:
+            counter = self.counters[product_id]
+            yield {
+                "name": counter.get("product_name"),
+                "brand": counter.get("product_brand"),
+                "category": counter.get("product_category"),
+                "price": counter.get("product_retail_price"),
+                "total_items": counter["total_items"],
+                "available_stock": counter["available_stock"],
+            }
+
+    def order_rows(self, after=None, limit=None, batch_size=None):
+        start = bisect.bisect_right(self.order_ids, after) if after is not None else 0
+        order_ids = self.order_ids[start:start + limit] if limit else self.order_ids[start:]
+        for order_id in order_ids:
+            order = self.orders[order_id]
+            row = {"id": order_id}
+            row.update({field: order[field] for field in ORDER_ROW_FIELDS if field in order})
+            yield row
+
+    def data_version(self, name):
+        # Loaded once and never modified, so the sizes identify the dataset
+        return f"memory-{len(self.counters)}-{len(self.orders)}"
+
+    def ping(self):
+        pass
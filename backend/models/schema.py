@@ -0,0 +1,57 @@
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING
+
+# Bump when collections or indexes below change, then run migrate_conversations.py
+SCHEMA_VERSION = 4
+SCHEMA_ID = "conversations"
+
+# user_stats and deletion_queue are keyed by _id, so that index is all they need
+COLLECTIONS = ["conversations", "messages", "user_stats", "archived_messages", "deletion_queue"]
+
+# (collection, keys, options); see index_advisor.py for how these were chosen
+INDEXES = [
+    # Per-user listing sorted by last_activity and the per-user statistics
+    ("conversations", [("user_id", ASCENDING), ("last_activity", DESCENDING)], {}),
+    # Message history and the last-message preview; conversation_id alone is a prefix
+    ("messages", [("conversation_id", ASCENDING), ("timestamp", ASCENDING)], {}),
+    # Idle-conversation scan for the archiver
+    ("conversations", [("last_activity", ASCENDING)], {}),
+    # Paged reads and deletion of a conversation's archive chunks
+    ("archived_messages", [("conversation_id", ASCENDING), ("chunk", ASCENDING)], {}),
+    # Oldest-first claiming of pending deletions
+    ("deletion_queue", [("enqueued_at", ASCENDING)], {}),
+]
+
+_checked_version = None
+
+
+def apply_schema(db):
+    """Create missing collections and indexes, then record the schema version (idempotent)"""
+    existing = set(db.list_collection_names())
+    for name in COLLECTIONS:
+        if name not in existing:
+            db.create_collection(name)
+
+    for collection, keys, options in INDEXES:
+        db[collection].create_index(keys, **options)
+
+    db.schema_version.update_one(
+        {"_id": SCHEMA_ID},
+        {"$set": {"version": SCHEMA_VERSION, "applied_at": datetime.utcnow()}},
+        upsert=True,
+    )
+    return SCHEMA_VERSION
+
+
+def check_schema_version(db):
+    """Return True if the database schema is current; the lookup happens once per process"""
+    global _checked_version
+    if _checked_version is None:
+        record = db.schema_version.find_one({"_id": SCHEMA_ID}) or {}
+        _checked_version = record.get("version", 0)
+        if _checked_version < SCHEMA_VERSION:
+            print(
+                f"⚠️ Conversation schema is at version {_checked_version}, expected {SCHEMA_VERSION}. "
+                "Run: python migrate_conversations.py"
+            )
+    return _checked_version >= SCHEMA_VERSION
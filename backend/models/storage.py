@@ -0,0 +1,41 @@
+"""Storage backend selection.
+
+STORAGE_BACKEND=mongo (default) uses MongoDB through ConversationManager and
+MongoCatalog. STORAGE_BACKEND=memory uses InMemoryConversationManager and an
+InMemoryCatalog loaded from the CSVs in STORAGE_DATA_DIR, so the API runs with
+no mongod at all (benchmarks, fake-LLM load tests, edge deployments).
+
+Both conversation stores expose the ConversationManager methods; both catalogs
+expose the MongoCatalog methods and return the same document shapes.
+"""
+import os
+import threading
+from models.catalog import MongoCatalog
+from models.conversation import ConversationManager
+from models.database import get_database
+from models.memory_store import InMemoryCatalog, InMemoryConversationManager
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").lower()
+STORAGE_DATA_DIR = os.getenv("STORAGE_DATA_DIR", "data")
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_conversation_store(backend=None):
+    if (backend or STORAGE_BACKEND) == "memory":
+        return InMemoryConversationManager()
+    return ConversationManager()
+
+
+def get_catalog(backend=None):
+    """Catalog for the configured backend; the in-memory one is loaded once per process"""
+    if (backend or STORAGE_BACKEND) != "memory":
+        return MongoCatalog.for_database(get_database())
+
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = InMemoryCatalog.from_csv(STORAGE_DATA_DIR)
+    return _catalog
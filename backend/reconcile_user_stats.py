@@ -0,0 +1,18 @@
+"""Recompute per-user conversation statistics from source to repair drift.
+
+    python reconcile_user_stats.py              # all users
+    python reconcile_user_stats.py <user_id>    # one user
+"""
+import sys
+from models.conversation import ConversationManager
+
+
+if __name__ == "__main__":
+    manager = ConversationManager()
+
+    if len(sys.argv) > 1:
+        stats = manager.reconcile_user_stats(sys.argv[1])
+        print(f"✅ Reconciled statistics for {sys.argv[1]}: {stats}")
+    else:
+        count = manager.reconcile_user_stats()
+        print(f"✅ Reconciled statistics for {count} users")
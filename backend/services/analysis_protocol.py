@@ -0,0 +1,102 @@
+import json
+from services.template_responder import classify_query
+
+
+QUERY_TYPES = ("product_search", "stock_check", "stock_nearby", "order_status", "category_browse", "top_products", "unclear")
+
+# Kept deliberately short: every token here is paid on every chat request
+ANALYSIS_PROMPT = (
+    "Classify an e-commerce support query. Reply with JSON only: "
+    '{"intents":[{"type":<one of ' + "|".join(QUERY_TYPES) + '>,"terms":[search terms]}],'
+    '"ask":<clarifying question or null>}. Use one intent per distinct question.'
+)
+
+ANALYSIS_MAX_TOKENS = 90
+
+_decoder = json.JSONDecoder()
+
+
+def _close_truncated(text):
+    """Close strings/brackets left open by a response cut off at max_tokens"""
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+
+    repaired = (text + ('"' if in_string else "")).rstrip()
+    if repaired.endswith(":"):
+        repaired += "null"
+    return repaired.rstrip(",") + "".join(reversed(stack))
+
+
+def extract_json_object(text):
+    """Return the first JSON object embedded in model output, tolerating prose, code fences and truncation"""
+    if not text:
+        return None
+
+    start = text.find("{")
+    while start != -1:
+        try:
+            obj, _ = _decoder.raw_decode(text, start)
+            if isinstance(obj, dict):
+                return obj
+        except json.JSONDecodeError:
+            try:
+                obj = json.loads(_close_truncated(text[start:]))
+                if isinstance(obj, dict):
+                    return obj
+            except json.JSONDecodeError:
+                pass
+        start = text.find("{", start + 1)
+    return None
+
+
+def _parse_intent(obj):
+    query_type = obj.get("type") or obj.get("query_type")
+    if query_type not in QUERY_TYPES:
+        return None
+    terms = obj.get("terms", obj.get("search_terms", []))
+    if isinstance(terms, str):
+        terms = [terms]
+    return {"query_type": query_type, "search_terms": [str(term) for term in terms if term]}
+
+
+def parse_analysis(text, query):
+    """Map the compact analysis reply onto the analysis dict used by data gathering"""
+    obj = extract_json_object(text)
+    if obj is None:
+        # Don't send the user down the "unclear" path just because the model rambled
+        return classify_query(query)
+
+    raw_intents = obj.get("intents") if isinstance(obj.get("intents"), list) else [obj]
+    intents = [intent for intent in (_parse_intent(raw) for raw in raw_intents if isinstance(raw, dict)) if intent]
+    if not intents:
+        return classify_query(query)
+
+    # Collapse duplicates the model sometimes emits for a single question
+    unique = []
+    for intent in intents:
+        if intent not in unique:
+            unique.append(intent)
+
+    ask = obj.get("ask")
+    return {
+        "query_type": unique[0]["query_type"],
+        "data_needed": unique[0]["query_type"],
+        "clarifying_questions": [ask] if ask else [],
+        "search_terms": unique[0]["search_terms"],
+        "intents": unique,
+    }
@@ -1,34 +1,73 @@
 import os
-import json
 import re
-from groq import Groq
+import logging
 from datetime import datetime
 from pymongo import MongoClient
+from services.template_responder import classify_query, build_template_response
+from services.llm_client import get_llm_client, usage_from_response
+from services.prompt_serializer import serialize_data_context, compact_conversation
+from services.order_lookup import extract_order_ids
+from services.profiling import stage
+from services.analysis_protocol import ANALYSIS_PROMPT, ANALYSIS_MAX_TOKENS, parse_analysis
+
+logger = logging.getLogger(__name__)
 
 
 class ChatbotService:
-    def __init__(self, collections, conversation_manager):
-        self.collections = collections
+    def __init__(self, catalog, conversation_manager):
+        self.catalog = catalog
         self.conversation_manager = conversation_manager
-        self.groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        self.llm_enabled = os.getenv("LLM_DISABLED", "false").lower() not in ("1", "true", "yes")
+        self.llm = get_llm_client() if self.llm_enabled else None
+        self.token_usage = {}
+        self.user_id = None
         
-    def process_query(self, query, conversation_id=None):
+    def process_query(self, query, conversation_id=None, use_llm=True, user_id=None):
         """Process user query with LLM and database integration"""
+        self.user_id = user_id
+        
+        # Degraded mode: fast-path classification and templated answer, no LLM round trips
+        if not (use_llm and self.llm_enabled):
+            return self._process_query_without_llm(query)
+        
+        # Both LLM calls share one deadline so a slow analysis eats into the response budget
+        deadline = self.llm.new_deadline()
         
         # Get conversation context if available
-        context = self._get_conversation_context(conversation_id) if conversation_id else ""
+        with stage("context"):
+            context = self._get_conversation_context(conversation_id) if conversation_id else ""
         
         # First, let the LLM understand the query and determine what data is needed
-        analysis_response = self._analyze_query_with_llm(query, context)
+        with stage("analysis"):
+            analysis_response = self._analyze_query_with_llm(query, context, deadline)
         
         # Based on LLM analysis, gather relevant data
-        data_context = self._gather_relevant_data(analysis_response, query)
+        with stage("gather"):
+            data_context = self._gather_relevant_data(analysis_response, query)
         
         # Generate final response with data context
-        final_response = self._generate_response_with_data(query, data_context, context)
+        with stage("response"):
+            final_response = self._generate_response_with_data(query, data_context, context, deadline)
+        final_response["usage"] = self.token_usage
         
         return final_response
     
+    def _record_usage(self, stage, response):
+        """Accumulate token usage for one LLM stage of this request"""
+        usage = usage_from_response(response)
+        stage_usage = self.token_usage.setdefault(stage, {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+        for key, value in usage.items():
+            stage_usage[key] += value
+    
+    def _process_query_without_llm(self, query):
+        """Answer structured queries from templates using rule-based intent classification"""
+        with stage("analysis"):
+            analysis = classify_query(query)
+        with stage("gather"):
+            data_context = self._gather_relevant_data(analysis, query)
+        with stage("response"):
+            return build_template_response(data_context, self._format_data_summary)
+    
     def _get_conversation_context(self, conversation_id):
         """Get recent conversation history for context"""
         if not conversation_id:
@@ -36,74 +75,56 @@ class ChatbotService:
             
         try:
             messages = self.conversation_manager.get_conversation_messages(conversation_id, limit=6)
-            context = "Previous conversation:\n"
-            for msg in messages[-6:]:  # Last 6 messages for context
-                role = "User" if msg["type"] == "user" else "Assistant"
-                context += f"{role}: {msg['content']}\n"
-            return context
+            # Last 6 messages, newest kept first when trimming to the token budget
+            return compact_conversation(messages[-6:])
         except:
             return ""
     
-    def _analyze_query_with_llm(self, query, context=""):
+    def _analyze_query_with_llm(self, query, context="", deadline=None):
         """Use LLM to analyze what the user is asking for"""
-        system_prompt = """You are an e-commerce customer support analyst. Analyze the user's query and determine:
-1. What type of information they need (product info, order status, stock levels, categories, etc.)
-2. What specific data should be retrieved from the database
-3. If the query is unclear, what clarifying questions to ask
-
-Respond in JSON format with these fields:
-- "query_type": type of query (product_search, stock_check, order_status, category_browse, top_products, unclear)
-- "data_needed": specific data to retrieve
-- "clarifying_questions": list of questions if query is unclear
-- "search_terms": relevant search terms extracted from the query
-
-E-commerce database contains: products, orders, inventory_items, users, distribution_centers"""
+        user_content = f"{context}\nQuery: {query}" if context else f"Query: {query}"
 
         try:
-            response = self.groq_client.chat.completions.create(
+            response = self.llm.chat(
+                deadline=deadline,
                 messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Context: {context}\n\nUser Query: {query}"}
+                    {"role": "system", "content": ANALYSIS_PROMPT},
+                    {"role": "user", "content": user_content}
                 ],
                 model="llama3-8b-8192",
                 temperature=0.1,
-                max_tokens=500
+                max_tokens=ANALYSIS_MAX_TOKENS,
+                response_format={"type": "json_object"}
             )
+            self._record_usage("analysis", response)
             
-            # Try to parse JSON response
-            try:
-                return json.loads(response.choices[0].message.content)
-            except json.JSONDecodeError:
-                # Fallback if JSON parsing fails
-                return {
-                    "query_type": "unclear",
-                    "data_needed": "general_help",
-                    "clarifying_questions": ["Could you please clarify what specific information you're looking for?"],
-                    "search_terms": []
-                }
+            # Tolerant parse; falls back to the rule-based classifier instead of "unclear"
+            return parse_analysis(response.choices[0].message.content, query)
                 
         except Exception as e:
-            print(f"LLM Analysis Error: {e}")
-            return {
-                "query_type": "unclear", 
-                "data_needed": "error",
-                "clarifying_questions": ["I'm having trouble understanding your request. Could you please rephrase?"],
-                "search_terms": []
-            }
+            logger.warning("LLM analysis failed, using rule-based classifier: %s", e)
+            # Fall back to the rule-based classifier so the data lookup still happens
+            return classify_query(query)
     
     def _gather_relevant_data(self, analysis, query):
         """Gather relevant data based on LLM analysis"""
         query_type = analysis.get("query_type", "unclear")
         search_terms = analysis.get("search_terms", [])
         
+        intents = [intent for intent in analysis.get("intents", []) if intent.get("query_type") != "unclear"]
+        if len(intents) > 1:
+            return self._gather_multi_intent_data(intents, query)
+        
         if query_type == "product_search":
             return self._get_product_data(query, search_terms)
         elif query_type == "stock_check":
             return self._get_stock_data(query, search_terms)
+        elif query_type == "stock_nearby":
+            return self._get_nearby_stock_data(query, search_terms)
         elif query_type == "order_status":
             return self._get_order_data(query)
         elif query_type == "top_products":
-            return self._get_top_products_data()
+            return self._get_top_products_data(search_terms)
         elif query_type == "category_browse":
             return self._get_category_data(query, search_terms)
         else:
@@ -112,119 +133,92 @@ E-commerce database contains: products, orders, inventory_items, users, distribu
     def _get_product_data(self, query, search_terms):
         """Get product information"""
         # Use search terms from LLM or fallback to original logic
-        search_query = " ".join(search_terms) if search_terms else query
-        
-        pipeline = [
-            {"$match": {"product_name": {"$regex": search_query, "$options": "i"}}},
-            {
-                "$group": {
-                    "_id": {
-                        "product_name": "$product_name",
-                        "product_brand": "$product_brand",
-                        "product_retail_price": "$product_retail_price",
-                        "product_category": "$product_category",
-                    },
-                    "total_items": {"$sum": 1},
-                    "available_stock": {
-                        "$sum": {"$cond": [{"$eq": ["$sold_at", None]}, 1, 0]}
-                    },
-                }
-            },
-            {"$limit": 5},
-        ]
-        
-        products = list(self.collections["inventory_items"].aggregate(pipeline))
-        return {"type": "products", "content": products}
+        return self.catalog.product_data(" ".join(search_terms) if search_terms else query)
     
     def _get_stock_data(self, query, search_terms):
         """Get stock information"""
         # Extract product name from search terms or query
         product_name = " ".join(search_terms) if search_terms else self._extract_product_name_from_stock_query(query)
+        return self.catalog.stock_data(product_name)
+    
+    def _get_nearby_stock_data(self, query, search_terms):
+        """Closest distribution center with stock for matching products"""
+        product_name = " ".join(search_terms) if search_terms else self._extract_product_name_from_stock_query(query)
         
-        pipeline = [
-            {
-                "$match": {
-                    "product_name": {"$regex": product_name, "$options": "i"},
-                    "sold_at": {"$exists": False},
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "product_name": "$product_name",
-                        "product_brand": "$product_brand",
-                        "product_retail_price": "$product_retail_price",
-                    },
-                    "stock_count": {"$sum": 1},
-                }
-            },
-            {"$limit": 3},
-        ]
+        location = self.catalog.user_location(self.user_id) if self.user_id is not None else None
+        if location is None:
+            return {"type": "nearby_stock", "content": [], "search_term": product_name, "location_known": False}
         
-        stock_data = list(self.collections["inventory_items"].aggregate(pipeline))
-        return {"type": "stock", "content": stock_data, "search_term": product_name}
+        content = self.catalog.nearby_stock(product_name, *location)
+        return {"type": "nearby_stock", "content": content, "search_term": product_name, "location_known": True}
     
     def _get_order_data(self, query):
-        """Get order information"""
-        order_id_match = re.search(r"(\d+)", query)
+        """Get order information with line items for every order id in the query"""
+        order_ids = extract_order_ids(query)
+        
+        if len(order_ids) == 1:
+            orders = self.catalog.get_orders(order_ids)
+            return {"type": "order", "content": orders[0] if orders else None, "order_id": order_ids[0]}
         
-        if order_id_match:
-            order_id = order_id_match.group(1)
-            order = self.collections["orders"].find_one({"order_id": order_id})
-            return {"type": "order", "content": order, "order_id": order_id}
+        if order_ids:
+            orders = self.catalog.get_orders(order_ids)
+            return {"type": "orders", "content": orders, "order_ids": order_ids}
+        
+        # "Where is my order?" without an id: the user's most recent orders
+        if self.user_id is not None:
+            orders = self.catalog.get_recent_orders(self.user_id)
+            if orders:
+                return {"type": "orders", "content": orders, "order_ids": [order["order_id"] for order in orders]}
         
         return {"type": "order", "content": None, "order_id": None}
     
-    def _get_top_products_data(self):
+    def _get_top_products_data(self, search_terms=None):
         """Get top selling products"""
-        pipeline = [
-            {"$match": {"sold_at": {"$exists": True, "$ne": None}}},
-            {
-                "$group": {
-                    "_id": {
-                        "product_name": "$product_name",
-                        "product_brand": "$product_brand",
-                        "product_retail_price": "$product_retail_price",
-                    },
-                    "sold_count": {"$sum": 1},
-                }
-            },
-            {"$sort": {"sold_count": -1}},
-            {"$limit": 5},
-        ]
-        
-        top_products = list(self.collections["inventory_items"].aggregate(pipeline))
-        return {"type": "top_products", "content": top_products}
+        return self.catalog.top_products_data(" ".join(search_terms or []))
     
     def _get_category_data(self, query, search_terms):
         """Get category information"""
         category = " ".join(search_terms) if search_terms else self._extract_category_from_query(query)
+        return self.catalog.category_data(category)
+    
+    def _inventory_request_for_intent(self, intent, query):
+        """(kind, term) catalog request for an intent, or None if it isn't answered from inventory"""
+        query_type = intent.get("query_type")
+        search_terms = intent.get("search_terms", [])
+        if query_type == "product_search":
+            return ("products", " ".join(search_terms) if search_terms else query)
+        if query_type == "stock_check":
+            return ("stock", " ".join(search_terms) if search_terms else self._extract_product_name_from_stock_query(query))
+        if query_type == "top_products":
+            return ("top_products", " ".join(search_terms))
+        if query_type == "category_browse":
+            return ("category", " ".join(search_terms) if search_terms else self._extract_category_from_query(query))
+        return None
+    
+    def _gather_multi_intent_data(self, intents, query):
+        """Answer every inventory intent with one catalog batch (a single $facet on Mongo) plus one orders lookup"""
+        requests = []
+        parts = []
+        for intent in intents:
+            request = self._inventory_request_for_intent(intent, query)
+            if request is not None:
+                requests.append(request)
+            elif intent.get("query_type") == "order_status":
+                parts.append(self._get_order_data(query))
+            elif intent.get("query_type") == "stock_nearby":
+                parts.append(self._get_nearby_stock_data(query, intent.get("search_terms", [])))
         
-        pipeline = [
-            {"$match": {"product_category": {"$regex": category, "$options": "i"}}},
-            {
-                "$group": {
-                    "_id": {
-                        "product_name": "$product_name",
-                        "product_brand": "$product_brand",
-                        "product_retail_price": "$product_retail_price",
-                    },
-                    "available_stock": {
-                        "$sum": {"$cond": [{"$eq": ["$sold_at", None]}, 1, 0]}
-                    },
-                }
-            },
-            {"$limit": 10},
-        ]
+        parts = self.catalog.inventory_batch(requests) + parts
         
-        products = list(self.collections["inventory_items"].aggregate(pipeline))
-        return {"type": "category", "content": products, "category": category}
+        if len(parts) == 1:
+            return parts[0]
+        return {"type": "multi", "content": parts}
     
-    def _generate_response_with_data(self, query, data_context, conversation_context=""):
+    def _generate_response_with_data(self, query, data_context, conversation_context="", deadline=None):
         """Generate final response using LLM with retrieved data"""
         
-        # Prepare data context for LLM
-        data_summary = self._format_data_for_llm(data_context)
+        # Prepare compact data context for LLM
+        data_summary = serialize_data_context(data_context)
         
         system_prompt = """You are a helpful e-commerce customer support chatbot. Use the provided data to answer the user's question accurately and helpfully.
 
@@ -238,17 +232,15 @@ Guidelines:
 
 Format responses clearly with bullet points or numbered lists when showing multiple items."""
 
-        user_message = f"""
-User Query: {query}
-
-Available Data: {data_summary}
-
-{f"Conversation Context: {conversation_context}" if conversation_context else ""}
-
-Please provide a helpful response based on the available data."""
+        message_parts = [f"User Query: {query}", f"Available Data:\n{data_summary}"]
+        if conversation_context:
+            message_parts.append(f"Conversation Context:\n{conversation_context}")
+        message_parts.append("Please provide a helpful response based on the available data.")
+        user_message = "\n\n".join(message_parts)
 
         try:
-            response = self.groq_client.chat.completions.create(
+            response = self.llm.chat(
+                deadline=deadline,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_message}
@@ -257,71 +249,100 @@ Please provide a helpful response based on the available data."""
                 temperature=0.3,
                 max_tokens=800
             )
+            self._record_usage("response", response)
             
             return {
                 "response": response.choices[0].message.content,
                 "type": data_context.get("type", "general"),
-                "data": data_context.get("content") if data_context.get("type") != "no_data" else None
+                "data": data_context.get("content") if data_context.get("type") != "no_data" else None,
+                "mode": "llm"
             }
             
         except Exception as e:
-            print(f"LLM Response Generation Error: {e}")
-            return {
-                "response": "I apologize, but I'm having trouble processing your request right now. Please try again or contact support if the problem persists.",
-                "type": "error"
-            }
+            logger.warning("LLM response generation failed, serving template: %s", e)
+            # Serve a templated answer from the data we already retrieved
+            return build_template_response(data_context, self._format_data_summary)
     
-    def _format_data_for_llm(self, data_context):
-        """Format retrieved data for LLM consumption"""
+    def _format_data_summary(self, data_context):
+        """Human-readable summary of retrieved data, used for templated answers"""
         data_type = data_context.get("type")
         content = data_context.get("content")
         
         if data_type == "products" and content:
-            formatted = "Product Information:\n"
+            lines = ["Product Information:"]
             for item in content:
                 product = item["_id"]
-                formatted += f"- {product['product_name']} by {product['product_brand']}: ${product['product_retail_price']:.2f} (Available: {item['available_stock']})\n"
-            return formatted
+                lines.append(f"- {product['product_name']} by {product['product_brand']}: ${product['product_retail_price']:.2f} (Available: {item['available_stock']})")
+            return "\n".join(lines)
             
         elif data_type == "stock" and content:
-            formatted = f"Stock Information for '{data_context.get('search_term', 'searched product')}':\n"
+            lines = [f"Stock Information for '{data_context.get('search_term', 'searched product')}':"]
             for item in content:
                 product = item["_id"]
-                formatted += f"- {product['product_name']} by {product['product_brand']}: {item['stock_count']} units in stock at ${product['product_retail_price']:.2f}\n"
-            return formatted
+                lines.append(f"- {product['product_name']} by {product['product_brand']}: {item['stock_count']} units in stock at ${product['product_retail_price']:.2f}")
+            return "\n".join(lines)
+            
+        elif data_type == "multi" and content:
+            return "\n\n".join(self._format_data_summary(part) for part in content)
+            
+        elif data_type == "nearby_stock" and content:
+            lines = [f"Nearest stock for '{data_context.get('search_term', 'searched product')}':"]
+            for item in content:
+                product = item["_id"]
+                if item["center"]:
+                    lines.append(f"- {product['product_name']} by {product['product_brand']}: {item['stock_count']} units at {item['center']} ({item['distance_km']:.0f} km away)")
+                else:
+                    lines.append(f"- {product['product_name']} by {product['product_brand']}: out of stock at every center")
+            return "\n".join(lines)
+            
+        elif data_type == "nearby_stock" and not data_context.get("location_known", True):
+            return "I don't have a location on file for you, so I can't check stock near you."
             
         elif data_type == "order" and content:
-            order = content
-            formatted = f"Order Information for Order #{data_context.get('order_id')}:\n"
-            formatted += f"- Status: {order['status']}\n"
-            formatted += f"- Items: {order['num_of_item']}\n"
-            formatted += f"- Created: {order['created_at']}\n"
-            if order.get('shipped_at'):
-                formatted += f"- Shipped: {order['shipped_at']}\n"
-            if order.get('delivered_at'):
-                formatted += f"- Delivered: {order['delivered_at']}\n"
-            return formatted
+            return self._format_order_summary(content, data_context.get('order_id'))
+            
+        elif data_type == "orders" and content:
+            return "\n\n".join(self._format_order_summary(order, order["order_id"]) for order in content)
             
         elif data_type == "top_products" and content:
-            formatted = "Top Selling Products:\n"
+            lines = ["Top Selling Products:"]
             for i, item in enumerate(content, 1):
                 product = item["_id"]
-                formatted += f"{i}. {product['product_name']} by {product['product_brand']}: ${product['product_retail_price']:.2f} (Sold: {item['sold_count']} units)\n"
-            return formatted
+                lines.append(f"{i}. {product['product_name']} by {product['product_brand']}: ${product['product_retail_price']:.2f} (Sold: {item['sold_count']} units)")
+            return "\n".join(lines)
             
         elif data_type == "category" and content:
-            formatted = f"Products in {data_context.get('category', 'selected')} category:\n"
+            lines = [f"Products in {data_context.get('category', 'selected')} category:"]
             for item in content:
                 product = item["_id"]
-                formatted += f"- {product['product_name']} by {product['product_brand']}: ${product['product_retail_price']:.2f} (Available: {item['available_stock']})\n"
-            return formatted
+                lines.append(f"- {product['product_name']} by {product['product_brand']}: ${product['product_retail_price']:.2f} (Available: {item['available_stock']})")
+            return "\n".join(lines)
             
         elif data_type == "order" and not content:
             return f"No order found for Order ID: {data_context.get('order_id', 'N/A')}"
             
+        elif data_type == "orders" and not content:
+            return f"No orders found for Order IDs: {', '.join(str(order_id) for order_id in data_context.get('order_ids', []))}"
+            
         else:
             return "No relevant data found for this query."
     
+    def _format_order_summary(self, order, order_id):
+        lines = [
+            f"Order Information for Order #{order_id}:",
+            f"- Status: {order['status']}",
+            f"- Items: {order['num_of_item']}",
+            f"- Created: {order['created_at']}",
+        ]
+        if order.get('shipped_at'):
+            lines.append(f"- Shipped: {order['shipped_at']}")
+        if order.get('delivered_at'):
+            lines.append(f"- Delivered: {order['delivered_at']}")
+        for item in order.get("items", []):
+            name = item.get("product_name") or f"Product {item.get('product_id')}"
+            lines.append(f"  - {name}: ${item.get('sale_price', 0):.2f} ({item.get('status', 'unknown')})")
+        return "\n".join(lines)
+    
     # Helper methods for backward compatibility
     def _extract_product_name_from_stock_query(self, query):
         words = query.split()
@@ -0,0 +1,275 @@
+import os
+import threading
+import time
+from datetime import datetime
+from pymongo.errors import OperationFailure, PyMongoError
+
+COUNTERS_COLLECTION = "inventory_counters"
+STATE_ID = "inventory_counters"
+
+POLL_INTERVAL = float(os.getenv("INVENTORY_POLL_INTERVAL", 30))
+RECONCILE_INTERVAL = float(os.getenv("INVENTORY_RECONCILE_INTERVAL", 3600))
+# Pending events are drained and each touched product recounted once per batch
+EVENT_BATCH_SIZE = int(os.getenv("INVENTORY_EVENT_BATCH", 1000))
+# After a drop, how long to wait for the reload's own counter rebuild before rebuilding anyway
+RELOAD_WAIT = float(os.getenv("INVENTORY_RELOAD_WAIT", 600))
+# Pre-images need MongoDB 6+ and changeStreamPreAndPostImages enabled on inventory_items
+USE_PRE_IMAGES = os.getenv("INVENTORY_PRE_IMAGES", "false").lower() in ("1", "true", "yes")
+
+# Error codes meaning "no change streams here" (standalone mongod) or "resume token too old"
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40415}
+RESUME_TOKEN_LOST = {260, 280, 286}
+
+PRODUCT_FIELDS = ["product_name", "product_brand", "product_category", "product_retail_price"]
+
+# An item is available while sold_at is missing or null
+UNSOLD = {"$eq": [{"$ifNull": ["$sold_at", None]}, None]}
+
+
+def rebuild_inventory_counters(db):
+    """Recompute every product's counters from inventory_items and swap them in with $out"""
+    product_fields = {field: {"$first": f"${field}"} for field in PRODUCT_FIELDS}
+    pipeline = [
+        {
+            "$group": {
+                "_id": {"product_id": "$product_id", "center": "$product_distribution_center_id"},
+                **product_fields,
+                "total": {"$sum": 1},
+                "available": {"$sum": {"$cond": [UNSOLD, 1, 0]}},
+            }
+        },
+        {
+            "$group": {
+                "_id": "$_id.product_id",
+                **product_fields,
+                "total_items": {"$sum": "$total"},
+                "available_stock": {"$sum": "$available"},
+                "centers": {"$push": {"k": {"$toString": "$_id.center"}, "v": "$available"}},
+            }
+        },
+        {
+            "$project": {
+                **{field: 1 for field in PRODUCT_FIELDS},
+                "total_items": 1,
+                "available_stock": 1,
+                "by_center": {"$arrayToObject": "$centers"},
+                "updated_at": "$$NOW",
+            }
+        },
+        {"$out": COUNTERS_COLLECTION},
+    ]
+    started = time.perf_counter()
+    db.inventory_items.aggregate(pipeline, allowDiskUse=True)
+    db[COUNTERS_COLLECTION].create_index("product_name")
+    db[COUNTERS_COLLECTION].create_index("updated_at")
+
+    db.worker_state.update_one(
+        {"_id": STATE_ID},
+        {"$set": {"rebuilt_at": datetime.utcnow(), "rebuild_seconds": time.perf_counter() - started}},
+        upsert=True,
+    )
+
+
+class InventoryCounterWorker:
+    """Keeps inventory_counters current by tailing a change stream on inventory_items
+
+    Falls back to periodic full rebuilds when change streams are unavailable
+    (standalone mongod). The resume token is persisted after every event so a
+    restarted worker continues where it left off; if the token has aged out of
+    the oplog the counters are rebuilt from scratch.
+
+    Events recount their products from inventory_items rather than applying an
+    $inc, so an event that a rebuild snapshot already includes (the stream opens
+    before the initial rebuild, and reconciles run with events still buffered)
+    is replayed harmlessly instead of being counted twice. Pending events are
+    drained first so each product is recounted once per batch, and after a drop
+    (load_data.py reloading) nothing is recounted until the reload has rebuilt
+    the counters itself.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.counters = db[COUNTERS_COLLECTION]
+        self._stop = threading.Event()
+        self._thread = None
+        self.mode = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="inventory-counters", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self._watch()
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    print("⚠️ Change streams unavailable, polling inventory counters instead")
+                    self._poll()
+                elif e.code in RESUME_TOKEN_LOST:
+                    print("⚠️ Inventory resume token expired, rebuilding counters")
+                    self._save_token(None)
+                else:
+                    print(f"❌ Inventory counter worker error: {e}")
+                    self._stop.wait(5)
+            except PyMongoError as e:
+                print(f"❌ Inventory counter worker error: {e}")
+                self._stop.wait(5)
+
+    def _load_state(self):
+        return self.db.worker_state.find_one({"_id": STATE_ID}) or {}
+
+    def _save_token(self, token):
+        self.db.worker_state.update_one(
+            {"_id": STATE_ID},
+            {"$set": {"resume_token": token, "last_event_at": datetime.utcnow()}},
+            upsert=True,
+        )
+
+    def _watch(self):
+        state = self._load_state()
+        options = {"full_document": "updateLookup"}
+        if USE_PRE_IMAGES:
+            options["full_document_before_change"] = "whenAvailable"
+        if state.get("resume_token"):
+            options["resume_after"] = state["resume_token"]
+        else:
+            # Start the stream before rebuilding so no sale between the two is missed;
+            # events the rebuild already saw are recounted, not double-counted
+            operation_time = self.db.command("hello").get("operationTime")
+            if operation_time is not None:
+                options["start_at_operation_time"] = operation_time
+            rebuild_inventory_counters(self.db)
+
+        self.mode = "change_stream"
+        last_reconcile = time.monotonic()
+        with self.db.inventory_items.watch(**options) as stream:
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    if time.monotonic() - last_reconcile > RECONCILE_INTERVAL:
+                        # Catches deletes that carried no product_id (no pre-image) and any other drift
+                        rebuild_inventory_counters(self.db)
+                        last_reconcile = time.monotonic()
+                    self._stop.wait(0.5)
+                    continue
+
+                product_ids = set()
+                token = None
+                while change is not None:
+                    if change["operationType"] in ("drop", "rename", "dropDatabase", "invalidate"):
+                        # The collection is being reloaded; recounting its inserts one batch at a time
+                        # (before load_data.py has even indexed product_id) would scan it over and over
+                        self._save_token(None)
+                        self._wait_for_reload(change.get("wallTime") or datetime.utcnow())
+                        return
+                    product_ids |= self.changed_products(change)
+                    token = stream.resume_token
+                    if len(product_ids) >= EVENT_BATCH_SIZE:
+                        break
+                    change = stream.try_next()
+
+                for product_id in product_ids:
+                    self._recount_product(product_id)
+                self._save_token(token)
+
+    def _wait_for_reload(self, dropped_at):
+        """Block until a counter rebuild newer than the drop has finished, or RELOAD_WAIT passes"""
+        self.mode = "waiting_for_reload"
+        deadline = time.monotonic() + RELOAD_WAIT
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            rebuilt_at = self._load_state().get("rebuilt_at")
+            if rebuilt_at is not None and rebuilt_at > dropped_at:
+                return
+            self._stop.wait(5)
+
+    def _poll(self):
+        self.mode = "polling"
+        while not self._stop.is_set():
+            rebuild_inventory_counters(self.db)
+            self._stop.wait(POLL_INTERVAL)
+
+    def changed_products(self, change):
+        """product_ids whose counters one inventory_items change event affects"""
+        operation = change["operationType"]
+        document = change.get("fullDocument")
+        before = change.get("fullDocumentBeforeChange")
+
+        if operation == "update":
+            description = change.get("updateDescription", {})
+            if not {"sold_at", "product_id"} & (
+                set(description.get("updatedFields", {})) | set(description.get("removedFields", []))
+            ):
+                return set()
+
+        # A delete without a pre-image doesn't tell us which product; the next reconcile picks it up
+        return {doc.get("product_id") for doc in (before, document) if doc is not None}
+
+    def _recount_product(self, product_id):
+        """Replace one product's counters with a fresh count from inventory_items"""
+        product_fields = {field: {"$first": f"${field}"} for field in PRODUCT_FIELDS}
+        rows = list(self.db.inventory_items.aggregate([
+            {"$match": {"product_id": product_id}},
+            {
+                "$group": {
+                    "_id": "$product_distribution_center_id",
+                    **product_fields,
+                    "total": {"$sum": 1},
+                    "available": {"$sum": {"$cond": [UNSOLD, 1, 0]}},
+                }
+            },
+        ]))
+        if not rows:
+            self.counters.delete_one({"_id": product_id})
+            return
+        self.counters.replace_one(
+            {"_id": product_id},
+            {
+                **{field: rows[0].get(field) for field in PRODUCT_FIELDS},
+                "total_items": sum(row["total"] for row in rows),
+                "available_stock": sum(row["available"] for row in rows),
+                "by_center": {str(row["_id"]): row["available"] for row in rows},
+                "updated_at": datetime.utcnow(),
+            },
+            upsert=True,
+        )
+
+
+class InventoryCounters:
+    """Read side: stock answers from inventory_counters instead of counting inventory_items"""
+
+    _ready = False
+
+    def __init__(self, db):
+        self.db = db
+        self.counters = db[COUNTERS_COLLECTION]
+
+    def is_ready(self):
+        """Counters are usable once a rebuild has completed at least once (cached once true)"""
+        if not InventoryCounters._ready:
+            state = self.db.worker_state.find_one({"_id": STATE_ID}, {"rebuilt_at": 1})
+            InventoryCounters._ready = bool(state and state.get("rebuilt_at"))
+        return InventoryCounters._ready
+
+    def search_in_stock(self, product_name, limit=3):
+        """Products matching the name that have stock, shaped like the stock aggregation"""
+        cursor = self.counters.find(
+            {"product_name": {"$regex": product_name, "$options": "i"}, "available_stock": {"$gt": 0}}
+        ).limit(limit)
+        return [
+            {
+                "_id": {
+                    "product_name": doc["product_name"],
+                    "product_brand": doc["product_brand"],
+                    "product_retail_price": doc["product_retail_price"],
+                },
+                "stock_count": doc["available_stock"],
+            }
+            for doc in cursor
+        ]
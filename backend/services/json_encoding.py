@@ -0,0 +1,49 @@
+import json
+import math
+from datetime import date, datetime, timezone
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # listed in requirements.txt; the stdlib fallback is much slower
+    orjson = None
+
+
+def _default(value):
+    """Types Mongo documents carry that JSON doesn't know about"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        # Stored datetimes are naive UTC; say so, or browsers parse them as local time
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if hasattr(value, "item"):  # numpy scalars left over from pandas-loaded documents
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _sanitize(value):
+    """Replace NaN/Infinity (pandas blanks) with None, which the stdlib encoder would emit as invalid JSON"""
+    if isinstance(value, float):
+        return None if math.isnan(value) or math.isinf(value) else value
+    if isinstance(value, dict):
+        return {key: _sanitize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_sanitize(item) for item in value]
+    return value
+
+
+def dumps(value):
+    """Serialize to a JSON string; uses orjson when installed (which already maps NaN to null)"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC).decode()
+    return json.dumps(_sanitize(value), default=_default, allow_nan=False, separators=(",", ":"))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider so jsonify handles ObjectId, datetimes and NaN without per-route rebuilding"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
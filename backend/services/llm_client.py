@@ -0,0 +1,336 @@
+import os
+import random
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the LLM cannot be called or did not answer in time"""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Raised when the circuit breaker is open and calls are short-circuited"""
+
+
+class DeadlineExceededError(LLMUnavailableError):
+    """Raised when the request budget runs out before the LLM answers"""
+
+
+class LLMPolicy:
+    """Timeout, retry, hedging and circuit breaker settings for LLM calls"""
+
+    def __init__(
+        self,
+        request_budget=8.0,
+        call_timeout=4.0,
+        min_call_timeout=0.25,
+        max_retries=2,
+        backoff_base=0.2,
+        backoff_max=2.0,
+        hedge=False,
+        hedge_delay=None,
+        hedge_quantile=0.95,
+        latency_window=100,
+        min_latency_samples=20,
+        failure_threshold=5,
+        reset_timeout=30.0,
+    ):
+        self.request_budget = request_budget
+        self.call_timeout = call_timeout
+        self.min_call_timeout = min_call_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Hedge after the hedge_quantile of recent call latencies; hedge_delay is used until
+        # min_latency_samples calls have been seen (no hedging before that if it is None)
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_quantile = hedge_quantile
+        self.latency_window = latency_window
+        self.min_latency_samples = min_latency_samples
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    @classmethod
+    def from_env(cls):
+        """Build a policy from LLM_* environment variables"""
+        hedge_delay = os.getenv("LLM_HEDGE_DELAY")
+        return cls(
+            request_budget=float(os.getenv("LLM_REQUEST_BUDGET", 8.0)),
+            call_timeout=float(os.getenv("LLM_CALL_TIMEOUT", 4.0)),
+            min_call_timeout=float(os.getenv("LLM_MIN_CALL_TIMEOUT", 0.25)),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", 2)),
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE", 0.2)),
+            backoff_max=float(os.getenv("LLM_BACKOFF_MAX", 2.0)),
+            hedge=os.getenv("LLM_HEDGE", "").lower() in ("1", "true", "yes"),
+            hedge_delay=float(hedge_delay) if hedge_delay else None,
+            hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", 0.95)),
+            latency_window=int(os.getenv("LLM_LATENCY_WINDOW", 100)),
+            min_latency_samples=int(os.getenv("LLM_LATENCY_MIN_SAMPLES", 20)),
+            failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", 5)),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", 30.0)),
+        )
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a call may go through, moving to half-open after the cooldown"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                # Let exactly one probe through; everyone else keeps failing fast
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+    def release(self):
+        """Hand back a half-open probe whose call said nothing about the provider's health"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                # Cooldown already elapsed, so the next request becomes the probe
+                self.state = self.OPEN
+
+
+class LatencyWindow:
+    """Rolling window of recent call latencies for picking the hedge delay"""
+
+    def __init__(self, size=100):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q):
+        """Nearest-rank quantile of the window, None while it is empty"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def is_caller_error(error):
+    """4xx responses other than 429: the provider answered, the request was wrong"""
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and 400 <= status_code < 500 and status_code != 429
+
+
+def is_retryable(error):
+    """Timeouts, connection errors, rate limits and 5xx responses are worth retrying"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    # groq.APITimeoutError / APIConnectionError carry no status code
+    return type(error).__name__ in ("APITimeoutError", "APIConnectionError")
+
+
+class ResilientLLMClient:
+    """Wraps a chat completion callable with deadlines, jittered retries, hedging and a circuit breaker"""
+
+    def __init__(self, completion_fn, policy=None, breaker=None, sleep=time.sleep, clock=time.monotonic):
+        self.completion_fn = completion_fn
+        self.policy = policy or LLMPolicy()
+        self.breaker = breaker or CircuitBreaker(self.policy.failure_threshold, self.policy.reset_timeout, clock)
+        self.sleep = sleep
+        self.clock = clock
+        self.latencies = LatencyWindow(self.policy.latency_window)
+        hedge_workers = int(os.getenv("LLM_HEDGE_WORKERS", 8))
+        # Hedges only go out when a worker is free right now; a queued hedge would fire too late to help
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="llm-hedge")
+        self._hedge_slots = threading.BoundedSemaphore(hedge_workers)
+
+    def new_deadline(self):
+        """Absolute deadline for one user request"""
+        return self.clock() + self.policy.request_budget
+
+    def chat(self, deadline=None, **kwargs):
+        """Call the LLM within the deadline, retrying retryable errors with full jitter"""
+        if deadline is None:
+            deadline = self.new_deadline()
+
+        last_error = None
+        for attempt in range(self.policy.max_retries + 1):
+            # Checked before taking a half-open probe, which must only go to a call that is made
+            remaining = deadline - self.clock()
+            if remaining < self.policy.min_call_timeout:
+                raise DeadlineExceededError("Request budget exhausted before LLM call") from last_error
+
+            if not self.breaker.allow_request():
+                raise CircuitOpenError("LLM circuit breaker is open")
+
+            timeout = min(self.policy.call_timeout, remaining)
+            recorded = False
+            try:
+                response = self._call(timeout, **kwargs)
+                self.breaker.record_success()
+                recorded = True
+                return response
+            except Exception as e:
+                last_error = e
+                if is_retryable(e):
+                    self.breaker.record_failure()
+                    recorded = True
+                elif is_caller_error(e):
+                    # Bad request or auth: the provider is up, so this must not trip the breaker
+                    self.breaker.record_success()
+                    recorded = True
+                if not is_retryable(e) or attempt == self.policy.max_retries:
+                    raise
+                backoff = random.uniform(0, min(self.policy.backoff_max, self.policy.backoff_base * 2 ** attempt))
+                if self.clock() + backoff + self.policy.min_call_timeout > deadline:
+                    raise DeadlineExceededError("Request budget exhausted while retrying") from e
+                logger.warning("LLM call failed (attempt %d): %s; retrying in %.2fs", attempt + 1, e, backoff)
+                self.sleep(backoff)
+            finally:
+                if not recorded:
+                    self.breaker.release()
+
+        raise last_error
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging: the recent latency quantile, or the configured delay while warming up"""
+        if not self.policy.hedge:
+            return None
+        if len(self.latencies) >= self.policy.min_latency_samples:
+            return self.latencies.quantile(self.policy.hedge_quantile)
+        return self.policy.hedge_delay
+
+    def _timed_completion(self, timeout, **kwargs):
+        started = self.clock()
+        response = self.completion_fn(timeout=timeout, **kwargs)
+        self.latencies.record(self.clock() - started)
+        return response
+
+    def _call(self, timeout, **kwargs):
+        """One attempt, optionally hedged with a duplicate request after hedge_delay()"""
+        hedge_delay = self.hedge_delay()
+        if hedge_delay is None or hedge_delay >= timeout:
+            return self._timed_completion(timeout, **kwargs)
+
+        started = self.clock()
+        settled = threading.Event()
+        # The primary gets its own thread so it starts immediately instead of queueing behind other calls
+        primary = Future()
+        threading.Thread(
+            target=self._run_into, args=(primary, settled, timeout), kwargs=kwargs, name="llm-primary", daemon=True
+        ).start()
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done:
+            settled.set()
+            return primary.result()
+
+        pending = {primary}
+        if self._hedge_slots.acquire(blocking=False):
+            hedge = Future()
+            hedge_timeout = max(self.policy.min_call_timeout, timeout - (self.clock() - started))
+            self._hedge_executor.submit(self._run_into, hedge, settled, hedge_timeout, **kwargs)
+            hedge.add_done_callback(lambda _: self._hedge_slots.release())
+            pending.add(hedge)
+
+        last_error = None
+        try:
+            while pending:
+                remaining = timeout - (self.clock() - started)
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    last_error = future.exception()
+        finally:
+            # Whatever is still outstanding lost (or timed out); a not-yet-sent hedge is never sent
+            settled.set()
+            for future in pending:
+                future.cancel()
+
+        if last_error is not None:
+            raise last_error
+        raise TimeoutError(f"LLM call timed out after {timeout:.2f}s")
+
+    def _run_into(self, future, settled, timeout, **kwargs):
+        """Run one completion into future unless the attempt was already settled or cancelled"""
+        if settled.is_set():
+            future.cancel()
+            return
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self._timed_completion(timeout, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+
+def usage_from_response(response):
+    """Token counts reported by the API, zeros if the response carries none"""
+    usage = getattr(response, "usage", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+    }
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """Process-wide client so breaker state is shared across requests"""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                from groq import Groq
+
+                # Retries are handled here, not inside the SDK
+                groq_client = Groq(
+                    api_key=os.getenv("GROQ_API_KEY"),
+                    base_url=os.getenv("GROQ_BASE_URL") or None,
+                    max_retries=0,
+                )
+                _default_client = ResilientLLMClient(
+                    groq_client.chat.completions.create, LLMPolicy.from_env()
+                )
+    return _default_client
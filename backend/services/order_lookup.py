@@ -0,0 +1,155 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+ORDER_ID_PATTERN = re.compile(r"#?\b(\d{1,12})\b")
+ORDER_KEYWORD = re.compile(r"\borders?\b|#", re.IGNORECASE)
+MAX_ORDERS_PER_QUERY = 5
+
+RECENT_ORDERS_TTL = float(os.getenv("RECENT_ORDERS_TTL", 60))
+RECENT_ORDERS_MAX_USERS = int(os.getenv("RECENT_ORDERS_MAX_USERS", 1000))
+RECENT_ORDERS_LIMIT = 5
+
+ITEM_FIELDS = {"_id": 0, "product_id": 1, "status": 1, "sale_price": 1, "shipped_at": 1, "delivered_at": 1, "returned_at": 1}
+PRODUCT_FIELDS = {"name": 1, "brand": 1, "category": 1, "retail_price": 1}
+
+
+def extract_order_ids(query):
+    """Numbers after the first mention of "order" (or every number if there is none), deduplicated"""
+    keyword = ORDER_KEYWORD.search(query)
+    # Skips counts like "top 5" that come before the order reference
+    start = keyword.start() if keyword else 0
+    order_ids = []
+    for match in ORDER_ID_PATTERN.finditer(query, start):
+        order_id = int(match.group(1))
+        if order_id not in order_ids:
+            order_ids.append(order_id)
+    return order_ids[:MAX_ORDERS_PER_QUERY]
+
+
+def numeric_order_ids(order_ids):
+    """Order ids as ints, skipping anything that isn't a number (e.g. terms extracted by the LLM)"""
+    numeric = []
+    for order_id in order_ids:
+        try:
+            numeric.append(int(order_id))
+        except (TypeError, ValueError):
+            continue
+    return numeric
+
+
+def _id_variants(order_ids):
+    """The loader stores order_id as an int; older data may hold strings, so match both"""
+    return [int(order_id) for order_id in order_ids] + [str(order_id) for order_id in order_ids]
+
+
+def order_detail_pipeline(match):
+    """Orders with their line items and each item's product in a single round trip"""
+    return [
+        {"$match": match},
+        {
+            "$lookup": {
+                "from": "order_items",
+                "localField": "order_id",
+                "foreignField": "order_id",
+                "pipeline": [{"$project": ITEM_FIELDS}],
+                "as": "items",
+            }
+        },
+        {
+            "$lookup": {
+                "from": "products",
+                "localField": "items.product_id",
+                "foreignField": "_id",
+                "pipeline": [{"$project": PRODUCT_FIELDS}],
+                "as": "item_products",
+            }
+        },
+    ]
+
+
+def _attach_products(order):
+    """Fold the looked-up products into their line items"""
+    products = {product["_id"]: product for product in order.pop("item_products", [])}
+    for item in order.get("items", []):
+        product = products.get(item.get("product_id"), {})
+        item["product_name"] = product.get("name")
+        item["product_brand"] = product.get("brand")
+    return order
+
+
+class RecentOrdersCache:
+    """Small LRU of each user's most recent orders with a TTL"""
+
+    def __init__(self, max_users=RECENT_ORDERS_MAX_USERS, ttl=RECENT_ORDERS_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            stored_at, orders = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return orders
+
+    def put(self, user_id, orders):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), orders)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+recent_orders_cache = RecentOrdersCache()
+
+
+class OrderLookup:
+    """Batched order-detail lookups joining orders, order_items and products"""
+
+    def __init__(self, collections, cache=recent_orders_cache):
+        self.orders = collections["orders"]
+        self.cache = cache
+
+    def get_orders(self, order_ids):
+        """Full details for the given ids, returned in the order they were asked for"""
+        order_ids = numeric_order_ids(order_ids)
+        if not order_ids:
+            return []
+        pipeline = order_detail_pipeline({"order_id": {"$in": _id_variants(order_ids)}})
+        found = {int(order["order_id"]): _attach_products(order) for order in self.orders.aggregate(pipeline)}
+        return [found[order_id] for order_id in order_ids if order_id in found]
+
+    def get_recent_orders(self, user_id):
+        """A user's latest orders with details, served from the per-user cache when fresh"""
+        orders = self.cache.get(str(user_id))
+        if orders is not None:
+            return orders
+
+        try:
+            user_match = {"user_id": {"$in": [int(user_id), str(user_id)]}}
+        except (TypeError, ValueError):
+            user_match = {"user_id": str(user_id)}
+        pipeline = [
+            {"$match": user_match},
+            {"$sort": {"created_at": -1}},
+            {"$limit": RECENT_ORDERS_LIMIT},
+        ] + order_detail_pipeline({})[1:]
+        orders = [_attach_products(order) for order in self.orders.aggregate(pipeline)]
+        self.cache.put(str(user_id), orders)
+        return orders
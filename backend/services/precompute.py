@@ -0,0 +1,42 @@
+import os
+from datetime import datetime, timedelta
+from pymongo import ReplaceOne
+
+RESULTS_COLLECTION = "precomputed_results"
+PRECOMPUTE_INTERVAL = float(os.getenv("PRECOMPUTE_INTERVAL", 300))
+# Results older than this are ignored and the query runs live
+PRECOMPUTE_MAX_AGE = timedelta(seconds=float(os.getenv("PRECOMPUTE_MAX_AGE", 3600)))
+# /api/products rows are stored in chunks to stay well under the 16MB document limit
+PRODUCT_CHUNK_SIZE = 1000
+
+
+class PrecomputedResults:
+    """Keyed results written by the scheduler jobs and read in place of live queries"""
+
+    def __init__(self, db):
+        self.results = db[RESULTS_COLLECTION]
+
+    def put_many(self, job, values):
+        """Store {key: value} for a job and drop keys that job no longer produces"""
+        computed_at = datetime.utcnow()
+        if values:
+            self.results.bulk_write([
+                ReplaceOne({"_id": key}, {"job": job, "value": value, "computed_at": computed_at}, upsert=True)
+                for key, value in values.items()
+            ])
+        self.results.delete_many({"job": job, "computed_at": {"$lt": computed_at}})
+        return len(values)
+
+    def get(self, key, max_age=PRECOMPUTE_MAX_AGE):
+        document = self.results.find_one({"_id": key, "computed_at": {"$gte": datetime.utcnow() - max_age}})
+        return document["value"] if document else None
+
+    def get_many(self, keys, max_age=PRECOMPUTE_MAX_AGE):
+        """Values for every key from a single run of their job, or None if any is missing or stale"""
+        documents = {
+            document["_id"]: document
+            for document in self.results.find({"_id": {"$in": keys}, "computed_at": {"$gte": datetime.utcnow() - max_age}})
+        }
+        if len(documents) != len(keys) or len({document["computed_at"] for document in documents.values()}) > 1:
+            return None
+        return [documents[key]["value"] for key in keys]
@@ -0,0 +1,290 @@
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+import numpy as np
+from services.inventory_counters import COUNTERS_COLLECTION, InventoryCounters
+
+logger = logging.getLogger(__name__)
+
+# Hashed feature space; large enough that char-trigram collisions are rare, cheap because storage is sparse
+VECTOR_DIM = 2 ** int(os.getenv("PRODUCT_INDEX_DIM_BITS", 18))
+REFRESH_INTERVAL = float(os.getenv("PRODUCT_INDEX_REFRESH", 30))
+REFRESH_OVERLAP = timedelta(seconds=5)
+# Updated rows are scored from a side table until this many pile up, then the index is rebuilt
+COMPACT_THRESHOLD = int(os.getenv("PRODUCT_INDEX_COMPACT_THRESHOLD", 500))
+MIN_SCORE = float(os.getenv("PRODUCT_INDEX_MIN_SCORE", 0.2))
+MIN_CATEGORY_SCORE = float(os.getenv("PRODUCT_INDEX_MIN_CATEGORY_SCORE", 0.4))
+
+PRODUCT_FIELDS = [("product_name", 1.0), ("product_brand", 1.0), ("product_category", 1.5)]
+CATEGORY_FIELDS = [("product_category", 1.0)]
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _bucket(feature):
+    # crc32 rather than hash(): bucket ids must not change between processes
+    return zlib.crc32(feature.encode()) % VECTOR_DIM
+
+
+_word_cache = {}
+
+
+def _word_buckets(word):
+    """Whole-word feature plus boundary-marked character trigrams ("coat" -> " co", "coa", "oat", "at ")"""
+    buckets = _word_cache.get(word)
+    if buckets is None:
+        padded = f" {word} "
+        buckets = [_bucket(f"w:{word}")] + [_bucket(f"c:{padded[i:i + 3]}") for i in range(len(padded) - 2)]
+        if len(_word_cache) < 200_000:
+            _word_cache[word] = buckets
+    return buckets
+
+
+def featurize(doc, fields):
+    """Weighted bucket counts for a document's text fields"""
+    features = Counter()
+    for field, weight in fields:
+        for word in WORD_PATTERN.findall(str(doc.get(field) or "").lower()):
+            # Singular/plural share most trigrams, but also index the stem so "coats" == "coat"
+            words = [word, word[:-1]] if len(word) > 3 and word.endswith("s") else [word]
+            for variant in words:
+                for bucket in _word_buckets(variant):
+                    features[bucket] += weight
+    return features
+
+
+class VectorIndex:
+    """Sparse hashed TF-IDF vectors over text fields with top-k cosine search
+
+    Vectors are stored column-major (bucket -> rows) in NumPy arrays, so a query
+    only touches the buckets it contains. upsert()/remove() mask the stored row and
+    keep the new vector in a small side table until COMPACT_THRESHOLD triggers a rebuild.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._lock = threading.Lock()
+        self.build([])
+
+    def build(self, docs):
+        docs = list(docs)
+        features = [featurize(doc, self.fields) for doc in docs]
+        n = len(docs)
+
+        df = np.zeros(VECTOR_DIM, dtype=np.float32)
+        for counts in features:
+            df[list(counts)] += 1
+        idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+
+        rows = np.fromiter((row for row, counts in enumerate(features) for _ in counts), dtype=np.int32)
+        cols = np.fromiter((bucket for counts in features for bucket in counts), dtype=np.int64)
+        tf = np.fromiter((value for counts in features for value in counts.values()), dtype=np.float32)
+        vals = (1 + np.log(tf)) * idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=vals ** 2, minlength=n)).astype(np.float32)
+        vals = vals / norms[rows]
+
+        order = np.argsort(cols, kind="stable")
+        with self._lock:
+            self.idf = idf
+            self.keys = [doc["_id"] for doc in docs]
+            self.docs = docs
+            self.row_of = {key: row for row, key in enumerate(self.keys)}
+            self._rows = rows[order]
+            self._vals = vals[order].astype(np.float32)
+            self._indptr = np.searchsorted(cols[order], np.arange(VECTOR_DIM + 1))
+            self._stored = np.ones(n, dtype=bool)
+            self._live = np.ones(n, dtype=bool)
+            self._pending = {}
+
+    def _vector(self, features):
+        if not features:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        cols = np.fromiter(features.keys(), dtype=np.int64)
+        vals = (1 + np.log(np.fromiter(features.values(), dtype=np.float32))) * self.idf[cols]
+        norm = np.sqrt((vals ** 2).sum())
+        return cols, vals / norm if norm else vals
+
+    def upsert(self, docs):
+        """Add or re-vectorize documents without rebuilding (IDF stays as of the last build)"""
+        with self._lock:
+            for doc in docs:
+                row = self.row_of.get(doc["_id"])
+                if row is None:
+                    row = len(self.keys)
+                    self.row_of[doc["_id"]] = row
+                    self.keys.append(doc["_id"])
+                    self.docs.append(doc)
+                    self._stored = np.append(self._stored, False)
+                    self._live = np.append(self._live, True)
+                else:
+                    self.docs[row] = doc
+                    self._stored[row] = False
+                    self._live[row] = True
+                self._pending[row] = self._vector(featurize(doc, self.fields))
+            compact = len(self._pending) > COMPACT_THRESHOLD
+        if compact:
+            self.compact()
+
+    def remove(self, keys):
+        """Drop documents from search results; their rows are reclaimed by the next compact()"""
+        with self._lock:
+            for key in keys:
+                row = self.row_of.get(key)
+                if row is not None:
+                    self._live[row] = False
+                    self._pending.pop(row, None)
+
+    def live_docs(self):
+        with self._lock:
+            return [doc for row, doc in enumerate(self.docs) if self._live[row]]
+
+    def compact(self):
+        """Rebuild from the live documents, folding in pending rows and refreshing IDF"""
+        self.build(self.live_docs())
+
+    def __len__(self):
+        return int(self._live.sum())
+
+    def __contains__(self, key):
+        row = self.row_of.get(key)
+        return row is not None and bool(self._live[row])
+
+    def search(self, text, k=5, min_score=MIN_SCORE):
+        """Top-k (doc, cosine score) pairs for a free-text query"""
+        query_cols, query_vals = self._vector(featurize({"text": text}, [("text", 1.0)]))
+        if not len(query_cols):
+            return []
+
+        with self._lock:
+            starts, ends = self._indptr[query_cols], self._indptr[query_cols + 1]
+            postings = [np.arange(start, end) for start, end in zip(starts, ends)]
+            positions = np.concatenate(postings) if postings else np.zeros(0, dtype=np.int64)
+            weights = np.repeat(query_vals, ends - starts) * self._vals[positions]
+            scores = np.bincount(self._rows[positions], weights=weights, minlength=len(self.keys))
+            scores[~self._stored] = 0
+
+            query = dict(zip(query_cols.tolist(), query_vals.tolist()))
+            for row, (cols, vals) in self._pending.items():
+                scores[row] = sum(query.get(col, 0.0) * val for col, val in zip(cols.tolist(), vals.tolist()))
+            scores[~self._live] = 0
+
+            k = min(k, len(scores))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.docs[row], float(scores[row])) for row in top if scores[row] >= min_score]
+
+
+class ProductIndex:
+    """Product and category vector indexes built from inventory_counters
+
+    Counters carry each product's name, brand and category plus an updated_at,
+    so refresh() only re-vectorizes products that changed since the last pass.
+    Products whose counters were deleted (no inventory left) are removed.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.products = VectorIndex(PRODUCT_FIELDS)
+        self.categories = VectorIndex(CATEGORY_FIELDS)
+        self._refresh_lock = threading.Lock()
+        self.refreshed_at = None
+        self._last_check = 0.0
+
+    def refresh(self):
+        """Apply counters changed since the last refresh; returns how many were read"""
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        query = {"updated_at": {"$gt": self.refreshed_at - REFRESH_OVERLAP}} if self.refreshed_at else {}
+        projection = {field: 1 for field, _ in PRODUCT_FIELDS}
+        started = datetime.utcnow()
+        changed = list(self.db[COUNTERS_COLLECTION].find(query, projection))
+
+        if self.refreshed_at is None:
+            self.products.build(changed)
+            gone = set()
+        else:
+            current = {doc["_id"] for doc in self.db[COUNTERS_COLLECTION].find({}, {"_id": 1})}
+            gone = {key for key in self.products.row_of if key not in current and key in self.products}
+            if gone:
+                self.products.remove(gone)
+            # Stock-only updates also bump updated_at; skip rows whose text is unchanged
+            text_changed = []
+            for doc in changed:
+                if doc["_id"] not in current:
+                    continue
+                if doc["_id"] not in self.products or self.products.docs[self.products.row_of[doc["_id"]]] != doc:
+                    text_changed.append(doc)
+            if text_changed:
+                self.products.upsert(text_changed)
+
+        known = {doc["_id"] for doc in self.categories.docs}
+        if gone:
+            # A category disappears with its last product
+            categories = {doc.get("product_category") for doc in self.products.live_docs()}
+        else:
+            categories = known | {doc.get("product_category") for doc in changed}
+        categories.discard(None)
+        categories.discard("")
+        if categories != known:
+            self.categories.build({"_id": name, "product_category": name} for name in categories)
+
+        self.refreshed_at = started
+        return len(changed)
+
+    def refresh_if_stale(self):
+        if time.monotonic() - self._last_check < REFRESH_INTERVAL:
+            return
+        # One refresh at a time; requests arriving meanwhile search the current index
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = time.monotonic()
+            self._refresh()
+        except Exception as e:
+            # Keep serving the index as of the last good refresh; retried after REFRESH_INTERVAL
+            logger.warning("Product index refresh failed: %s", e)
+        finally:
+            self._refresh_lock.release()
+
+    def search_products(self, text, k=5):
+        """Ranked product ids (inventory product_id strings) most similar to the text"""
+        return [doc["_id"] for doc, _ in self.products.search(text, k)]
+
+    def best_category(self, text):
+        """The category closest to the text, or None if nothing is similar enough"""
+        matches = self.categories.search(text, k=1, min_score=MIN_CATEGORY_SCORE)
+        return matches[0][0]["product_category"] if matches else None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_product_index(db):
+    """Process-wide index, or None until inventory_counters has been built"""
+    global _index
+    if _index is None:
+        if not InventoryCounters(db).is_ready():
+            return None
+        with _index_lock:
+            if _index is None:
+                index = ProductIndex(db)
+                try:
+                    index.refresh()
+                except Exception as e:
+                    # Callers fall back to regex matching; the build is retried on the next call
+                    logger.warning("Product index build failed: %s", e)
+                    return None
+                index._last_check = time.monotonic()
+                _index = index
+    _index.refresh_if_stale()
+    return _index
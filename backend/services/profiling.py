@@ -0,0 +1,213 @@
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pymongo import monitoring
+from services import json_encoding
+
+# Fraction of requests run under cProfile; admins can also ask for it with the PROFILE_HEADER header
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_HEADER = "X-Profile"
+# Requests slower than this are dumped even when they weren't profiled
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 3000))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("reports", "profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 100))
+PSTATS_LINES = 40
+# User queries are left out of saved profiles (only their length is kept) unless this is set
+PROFILE_STORE_QUERIES = os.getenv("PROFILE_STORE_QUERIES", "false").lower() in ("1", "true", "yes")
+QUERY_PREVIEW_CHARS = 200
+
+PROFILE_ID = re.compile(r"^[0-9]{8}T[0-9]{12}-[0-9a-f]{8}$")
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("request_profile", default=None)
+_write_lock = threading.Lock()
+# cProfile can only be active once per interpreter; concurrent requests skip it and keep the cheap timings
+_profiler_lock = threading.Lock()
+
+
+def _redact(metadata):
+    """Metadata as written to disk: the raw query is replaced by its length unless PROFILE_STORE_QUERIES"""
+    if "query" not in metadata:
+        return metadata
+    metadata = dict(metadata)
+    query = metadata.pop("query") or ""
+    metadata["query_chars"] = len(query)
+    if PROFILE_STORE_QUERIES:
+        metadata["query"] = query[:QUERY_PREVIEW_CHARS]
+    return metadata
+
+
+class RequestProfile:
+    """What one request spent its time on: stages, Mongo commands and LLM tokens"""
+
+    def __init__(self, name, metadata=None):
+        self.id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+        self.name = name
+        self.metadata = _redact(metadata or {})
+        self.started_at = datetime.utcnow()
+        self.stages = {}
+        self.mongo_commands = []
+        self.token_usage = {}
+        self.profiler = None
+        self.elapsed_ms = None
+
+    def record_command(self, event, failed=False):
+        self.mongo_commands.append({
+            "command": event.command_name,
+            "database": event.database_name,
+            "duration_ms": event.duration_micros / 1000,
+            "failed": failed,
+        })
+
+    def to_dict(self):
+        by_command = {}
+        for command in self.mongo_commands:
+            totals = by_command.setdefault(command["command"], {"count": 0, "duration_ms": 0.0})
+            totals["count"] += 1
+            totals["duration_ms"] += command["duration_ms"]
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "elapsed_ms": self.elapsed_ms,
+            "profiled": self.profiler is not None,
+            "metadata": self.metadata,
+            "stages_ms": self.stages,
+            "mongo": {
+                "total_ms": sum(command["duration_ms"] for command in self.mongo_commands),
+                "by_command": by_command,
+                "commands": self.mongo_commands,
+            },
+            "token_usage": self.token_usage,
+        }
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Attributes each Mongo command's server round trip to the request that issued it"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        profile = _current.get()
+        if profile is not None:
+            profile.record_command(event)
+
+    def failed(self, event):
+        profile = _current.get()
+        if profile is not None:
+            profile.record_command(event, failed=True)
+
+
+command_timer = CommandTimer()
+
+
+@contextmanager
+def stage(name):
+    """Time a block as a named stage of the current request (no-op outside profile_request)"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.stages[name] = profile.stages.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def should_profile(headers, allow_header=False):
+    """Sample the request, or honor PROFILE_HEADER when the caller passed the admin check"""
+    if allow_header and headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes"):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+@contextmanager
+def profile_request(name, profile=False, metadata=None):
+    """Collect timings for a request; write them out if it was profiled or slower than SLOW_REQUEST_MS"""
+    request_profile = RequestProfile(name, metadata)
+    token = _current.set(request_profile)
+    if profile and _profiler_lock.acquire(blocking=False):
+        request_profile.profiler = cProfile.Profile()
+        request_profile.profiler.enable()
+    started = time.perf_counter()
+    try:
+        yield request_profile
+    finally:
+        if request_profile.profiler is not None:
+            request_profile.profiler.disable()
+            _profiler_lock.release()
+        request_profile.elapsed_ms = (time.perf_counter() - started) * 1000
+        _current.reset(token)
+        if request_profile.profiler is not None or request_profile.elapsed_ms >= SLOW_REQUEST_MS:
+            # Diagnostics must never replace the response or mask the request's own error
+            try:
+                save_profile(request_profile)
+            except Exception as e:
+                logger.warning("Could not save profile %s: %s", request_profile.id, e)
+
+
+def save_profile(request_profile):
+    """Write <id>.json (and <id>.prof with cProfile data) to PROFILE_DIR, keeping the newest PROFILE_KEEP"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    report = request_profile.to_dict()
+    base = os.path.join(PROFILE_DIR, request_profile.id)
+
+    if request_profile.profiler is not None:
+        request_profile.profiler.dump_stats(f"{base}.prof")
+        text = io.StringIO()
+        pstats.Stats(request_profile.profiler, stream=text).sort_stats("cumulative").print_stats(PSTATS_LINES)
+        report["pstats"] = text.getvalue()
+
+    with _write_lock:
+        with open(f"{base}.json", "w") as f:
+            f.write(json_encoding.dumps(report))
+        # Ids start with a UTC timestamp, so name order is age order
+        saved = sorted((name for name in os.listdir(PROFILE_DIR) if name.endswith(".json")), reverse=True)
+        for old in saved[PROFILE_KEEP:]:
+            for extension in (".json", ".prof"):
+                path = os.path.join(PROFILE_DIR, old[:-len(".json")] + extension)
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def list_profiles():
+    """Saved profiles, newest first, without their command lists or pstats text"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not filename.endswith(".json"):
+            continue
+        with open(os.path.join(PROFILE_DIR, filename)) as f:
+            report = json.load(f)
+        profiles.append({
+            "id": report["id"],
+            "name": report["name"],
+            "started_at": report["started_at"],
+            "elapsed_ms": report["elapsed_ms"],
+            "profiled": report["profiled"],
+            "stages_ms": report["stages_ms"],
+        })
+    return profiles
+
+
+def profile_path(profile_id, extension):
+    """Path of a saved profile file, or None for unknown or malformed ids"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}{extension}")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,157 @@
+import os
+
+
+# Maximum rows sent to the LLM per data type; override with PROMPT_ITEM_CAPS="category=5,products=3"
+DEFAULT_ITEM_CAPS = {"products": 5, "stock": 3, "nearby_stock": 5, "top_products": 5, "category": 6}
+
+DATA_TOKEN_BUDGET = int(os.getenv("PROMPT_DATA_TOKEN_BUDGET", 400))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", 200))
+CONTEXT_MESSAGE_CHARS = 200
+
+# (column, group key or count field) per aggregation result type
+COLUMNS = {
+    "products": [("name", "product_name"), ("brand", "product_brand"), ("category", "product_category"),
+                 ("price", "product_retail_price"), ("available", "available_stock")],
+    "stock": [("name", "product_name"), ("brand", "product_brand"), ("price", "product_retail_price"),
+              ("in_stock", "stock_count")],
+    "nearby_stock": [("name", "product_name"), ("brand", "product_brand"), ("price", "product_retail_price"),
+                     ("nearest_center", "center"), ("km", "distance_km"), ("in_stock", "stock_count")],
+    "top_products": [("name", "product_name"), ("brand", "product_brand"), ("price", "product_retail_price"),
+                     ("sold", "sold_count")],
+    "category": [("name", "product_name"), ("brand", "product_brand"), ("price", "product_retail_price"),
+                 ("available", "available_stock")],
+}
+
+ORDER_FIELDS = ["status", "num_of_item", "created_at", "shipped_at", "delivered_at", "returned_at"]
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English/Llama tokenizers)"""
+    return (len(text) + 3) // 4
+
+
+def load_item_caps():
+    caps = dict(DEFAULT_ITEM_CAPS)
+    for pair in os.getenv("PROMPT_ITEM_CAPS", "").split(","):
+        if "=" in pair:
+            key, value = pair.split("=", 1)
+            caps[key.strip()] = int(value)
+    return caps
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def _row_values(item, columns):
+    group = item.get("_id") if isinstance(item.get("_id"), dict) else {}
+    return [_cell(group[key] if key in group else item.get(key)) for _, key in columns]
+
+
+def serialize_rows(data_type, content, title, max_items=None, token_budget=DATA_TOKEN_BUDGET):
+    """Pipe-separated table with constant columns hoisted into the title line"""
+    columns = COLUMNS[data_type]
+    rows = [_row_values(item, columns) for item in content[:max_items]]
+
+    # Hoist columns whose value is identical on every row (e.g. a single brand or category)
+    shared = []
+    keep = list(range(len(columns)))
+    if len(rows) > 1:
+        keep = []
+        for index, (name, _) in enumerate(columns):
+            values = {row[index] for row in rows}
+            if len(values) == 1:
+                shared.append(f"{name}={values.pop()}")
+            else:
+                keep.append(index)
+
+    header_parts = [title] + shared
+    lines = ["; ".join(header_parts), "|".join(columns[i][0] for i in keep)]
+    used = estimate_tokens("\n".join(lines))
+
+    omitted = len(content) - len(rows)
+    for position, row in enumerate(rows):
+        line = "|".join(row[i] for i in keep)
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            omitted += len(rows) - position
+            break
+        lines.append(line)
+        used += cost
+
+    if omitted:
+        lines.append(f"(+{omitted} more not shown)")
+    return "\n".join(lines)
+
+
+def serialize_order(order, order_id):
+    parts = [f"order {order_id}"]
+    parts.extend(f"{field}={_cell(order[field])}" for field in ORDER_FIELDS if order.get(field) not in (None, ""))
+    items = [
+        f"{item.get('product_name') or item.get('product_id')}/{_cell(item.get('sale_price'))}/{item.get('status', '')}"
+        for item in order.get("items", [])
+    ]
+    if items:
+        parts.append(f"items(name/price/status)={', '.join(items)}")
+    return "; ".join(parts)
+
+
+def serialize_data_context(data_context, item_caps=None, token_budget=DATA_TOKEN_BUDGET):
+    """Token-efficient rendering of a gathered data context for the response prompt"""
+    data_type = data_context.get("type")
+    content = data_context.get("content")
+    caps = item_caps or load_item_caps()
+
+    if data_type == "multi":
+        # Split the budget so one large intent can't crowd out the others
+        share = token_budget // max(1, len(content))
+        return "\n\n".join(serialize_data_context(part, caps, share) for part in content)
+
+    if data_type == "orders":
+        if not content:
+            return f"no orders found for ids {', '.join(str(order_id) for order_id in data_context.get('order_ids', []))}"
+        return "\n".join(serialize_order(order, order["order_id"]) for order in content)
+
+    if data_type == "order":
+        if not content:
+            return f"no order found for id {data_context.get('order_id', 'N/A')}"
+        return serialize_order(content, data_context.get("order_id"))
+
+    if data_type == "nearby_stock" and not data_context.get("location_known", True):
+        return "user location unknown; cannot check nearby stock"
+
+    if data_type not in COLUMNS or not content:
+        return "no matching data"
+
+    if data_type == "stock":
+        title = f"stock for '{data_context.get('search_term', '')}'"
+    elif data_type == "nearby_stock":
+        title = f"nearest center with stock for '{data_context.get('search_term', '')}'"
+    elif data_type == "category":
+        title = f"category '{data_context.get('category', '')}'"
+    elif data_type == "top_products":
+        title = "top sellers, ranked"
+    else:
+        title = "products"
+    return serialize_rows(data_type, content, title, caps.get(data_type), token_budget)
+
+
+def compact_conversation(messages, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Most recent turns first-fit into the budget, returned oldest to newest"""
+    lines = []
+    used = 0
+    for msg in reversed(messages):
+        content = msg["content"]
+        if len(content) > CONTEXT_MESSAGE_CHARS:
+            content = content[:CONTEXT_MESSAGE_CHARS] + "..."
+        line = f"{'U' if msg['type'] == 'user' else 'A'}: {content}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(reversed(lines))
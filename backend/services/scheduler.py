@@ -0,0 +1,162 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+LEASE_COLLECTION = "scheduler_leases"
+JOBS_COLLECTION = "scheduler_jobs"
+LEASE_TTL = timedelta(seconds=float(os.getenv("SCHEDULER_LEASE_TTL", 120)))
+TICK_INTERVAL = float(os.getenv("SCHEDULER_TICK", 10))
+# A result older than this many intervals is reported as stale
+STALE_AFTER_INTERVALS = 2
+
+
+class Job:
+    def __init__(self, name, interval, run):
+        self.name = name
+        self.interval = interval
+        self.run = run
+
+
+class JobScheduler:
+    """Runs periodic jobs in one process across all API workers
+
+    Every worker runs the loop, but only the holder of the lease document in
+    scheduler_leases executes jobs. The lease is renewed before each job and
+    taken over by another worker once it expires. Run history goes to scheduler_jobs.
+    """
+
+    def __init__(self, db, jobs, lease_id="default", on_start=None):
+        self.db = db
+        self.jobs = {job.name: job for job in jobs}
+        self.lease_id = lease_id
+        self.on_start = on_start
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name=f"scheduler-{self.lease_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._release_lease()
+
+    def _loop(self):
+        if self.on_start:
+            try:
+                self.on_start()
+            except Exception:
+                logger.exception("Scheduler start hook failed")
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except PyMongoError as e:
+                logger.warning("Scheduler tick failed: %s", e)
+                self.is_leader = False
+            self._stop.wait(TICK_INTERVAL)
+
+    def _acquire_lease(self):
+        """Take or renew the lease; True if this process is the leader"""
+        now = datetime.utcnow()
+        try:
+            lease = self.db[LEASE_COLLECTION].find_one_and_update(
+                {"_id": self.lease_id, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + LEASE_TTL, "renewed_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Another worker holds an unexpired lease, so the upsert collided with its document
+            lease = None
+        self.is_leader = lease is not None
+        return self.is_leader
+
+    def _release_lease(self):
+        try:
+            self.db[LEASE_COLLECTION].delete_one({"_id": self.lease_id, "owner": self.owner})
+        except PyMongoError:
+            pass
+
+    def due_jobs(self):
+        now = datetime.utcnow()
+        states = {state["_id"]: state for state in self.db[JOBS_COLLECTION].find({"_id": {"$in": list(self.jobs)}})}
+        due = []
+        for name, job in self.jobs.items():
+            # Scheduled from the last start, so a failing job retries once per interval rather than every tick
+            started = states.get(name, {}).get("last_started")
+            if started is None or now - started >= timedelta(seconds=job.interval):
+                due.append(job)
+        return due
+
+    def tick(self):
+        """Run every due job if this process holds the lease"""
+        if not self._acquire_lease():
+            return []
+        ran = []
+        for job in self.due_jobs():
+            # Renew before each job so a long run doesn't let the lease lapse mid-way
+            if not self._acquire_lease():
+                break
+            run_job(self.db, job)
+            ran.append(job.name)
+        return ran
+
+    def status(self):
+        """Per-job durations and staleness, plus who holds the lease"""
+        now = datetime.utcnow()
+        lease = self.db[LEASE_COLLECTION].find_one({"_id": self.lease_id}) or {}
+        states = {state["_id"]: state for state in self.db[JOBS_COLLECTION].find({"_id": {"$in": list(self.jobs)}})}
+        jobs = []
+        for name, job in self.jobs.items():
+            state = states.get(name, {})
+            finished = state.get("last_finished")
+            age = (now - finished).total_seconds() if finished else None
+            jobs.append({
+                "name": name,
+                "interval_seconds": job.interval,
+                "last_started": state.get("last_started"),
+                "last_finished": finished,
+                "duration_ms": state.get("duration_ms"),
+                "runs": state.get("runs", 0),
+                "last_error": state.get("last_error"),
+                "age_seconds": age,
+                "stale": age is None or age > job.interval * STALE_AFTER_INTERVALS,
+            })
+        return {
+            "leader": lease.get("owner"),
+            "lease_expires_at": lease.get("expires_at"),
+            "this_process": self.owner,
+            "is_leader": self.is_leader,
+            "jobs": jobs,
+        }
+
+
+def run_job(db, job):
+    """Run one job now and record its duration (or error) in scheduler_jobs"""
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    error = None
+    try:
+        job.run(db)
+    except Exception as e:
+        logger.exception("Job %s failed", job.name)
+        error = str(e)
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    update = {"$set": {"last_started": started_at, "duration_ms": duration_ms, "last_error": error}, "$inc": {"runs": 1}}
+    if error is None:
+        update["$set"]["last_finished"] = datetime.utcnow()
+    db[JOBS_COLLECTION].update_one({"_id": job.name}, update, upsert=True)
+    return error is None
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from services.inventory_counters import COUNTERS_COLLECTION
+
+EARTH_RADIUS_KM = 6371.0
+REFRESH_INTERVAL = float(os.getenv("STOCK_MATRIX_REFRESH", 30))
+# Re-read a few seconds of overlap so clock skew between writers and this process can't drop updates
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distance from one point to arrays of points, in kilometres"""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class StockSnapshot:
+    """One immutable version of the matrix; refresh() publishes a new one instead of mutating"""
+
+    def __init__(self, products, stock):
+        self.products = products
+        self.stock = stock
+        self.product_row = {product["product_id"]: row for row, product in enumerate(products)}
+        self.names_lower = [product["product_name"].lower() for product in products]
+
+    def find_products(self, search_term, limit=5):
+        """Rows whose product name contains every search word"""
+        words = search_term.lower().split()
+        rows = []
+        for row, name in enumerate(self.names_lower):
+            if all(word in name for word in words):
+                rows.append(row)
+                if len(rows) >= limit:
+                    break
+        return rows
+
+
+def _product_entry(doc):
+    return {
+        "product_id": doc["_id"],
+        "product_name": doc.get("product_name") or "",
+        "product_brand": doc.get("product_brand"),
+        "product_retail_price": doc.get("product_retail_price"),
+    }
+
+
+class StockMatrix:
+    """In-memory product x distribution-center stock matrix built from inventory_counters
+
+    Rows are products, columns are distribution centers. refresh() only reloads
+    counters whose updated_at moved since the previous refresh, but rebuilds the
+    row index from the current set of counter ids so removed products drop out.
+    Readers take self.snapshot once and use it throughout.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._refresh_lock = threading.Lock()
+        self.refreshed_at = None
+        self._last_check = 0.0
+
+        centers = list(self.db.distribution_centers.find({}, {"id": 1, "name": 1, "latitude": 1, "longitude": 1}))
+        centers.sort(key=lambda center: center["id"])
+        self.center_ids = [str(center["id"]) for center in centers]
+        self.center_names = [center["name"] for center in centers]
+        self.center_column = {center_id: i for i, center_id in enumerate(self.center_ids)}
+        self.center_lats = np.array([center["latitude"] for center in centers], dtype=np.float64)
+        self.center_lons = np.array([center["longitude"] for center in centers], dtype=np.float64)
+
+        self.snapshot = StockSnapshot([], np.zeros((0, len(centers)), dtype=np.int32))
+
+    def refresh(self):
+        """Publish a new snapshot with counters changed since the last refresh applied"""
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        counters = self.db[COUNTERS_COLLECTION]
+        query = {"updated_at": {"$gt": self.refreshed_at - REFRESH_OVERLAP}} if self.refreshed_at else {}
+        started = datetime.utcnow()
+        changed = {doc["_id"]: doc for doc in counters.find(query)}
+        if self.refreshed_at:
+            product_ids = [doc["_id"] for doc in counters.find({}, {"_id": 1})]
+        else:
+            product_ids = list(changed)
+
+        old = self.snapshot
+        # Counters upserted between the two reads aren't in either the changed set or the old snapshot
+        missing = [pid for pid in product_ids if pid not in changed and pid not in old.product_row]
+        if missing:
+            changed.update((doc["_id"], doc) for doc in counters.find({"_id": {"$in": missing}}))
+
+        products = []
+        stock = np.zeros((len(product_ids), len(self.center_ids)), dtype=np.int32)
+        for row, product_id in enumerate(product_ids):
+            doc = changed.get(product_id)
+            if doc is None:
+                old_row = old.product_row[product_id]
+                products.append(old.products[old_row])
+                stock[row] = old.stock[old_row]
+                continue
+            products.append(_product_entry(doc))
+            for center_id, count in (doc.get("by_center") or {}).items():
+                column = self.center_column.get(center_id)
+                if column is not None:
+                    stock[row, column] = count
+
+        self.snapshot = StockSnapshot(products, stock)
+        self.refreshed_at = started
+        return len(changed)
+
+    def refresh_if_stale(self):
+        if time.monotonic() - self._last_check < REFRESH_INTERVAL:
+            return
+        # One refresh at a time; requests arriving meanwhile keep reading the current snapshot
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = time.monotonic()
+            self._refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def nearest_centers(self, lat, lon):
+        """Center columns ordered by distance, with the distances in km"""
+        distances = haversine_km(lat, lon, self.center_lats, self.center_lons)
+        order = np.argsort(distances)
+        return order, distances[order]
+
+    def nearby(self, search_term, lat, lon, limit=5):
+        """Closest center with stock for each product matching search_term"""
+        snapshot = self.snapshot
+        rows = snapshot.find_products(search_term, limit=limit)
+        return self.in_stock_near(snapshot, rows, lat, lon) if rows else []
+
+    def in_stock_near(self, snapshot, rows, lat, lon):
+        """For each product row of snapshot, the closest center that has stock"""
+        order, distances = self.nearest_centers(lat, lon)
+        # Columns reordered nearest-first; argmax finds the first center with stock
+        by_distance = snapshot.stock[np.asarray(rows, dtype=np.intp)][:, order] > 0
+        has_stock = by_distance.any(axis=1)
+        first = by_distance.argmax(axis=1)
+
+        results = []
+        for i, row in enumerate(rows):
+            product = snapshot.products[row]
+            if not has_stock[i]:
+                results.append({"product": product, "center": None, "distance_km": None, "stock_count": 0})
+                continue
+            column = order[first[i]]
+            results.append({
+                "product": product,
+                "center": self.center_names[column],
+                "distance_km": round(float(distances[first[i]]), 1),
+                "stock_count": int(snapshot.stock[row, column]),
+            })
+        return results
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+def get_stock_matrix(db):
+    """Process-wide matrix, loaded on first use and refreshed at most every STOCK_MATRIX_REFRESH seconds"""
+    global _matrix
+    if _matrix is None:
+        with _matrix_lock:
+            if _matrix is None:
+                matrix = StockMatrix(db)
+                matrix.refresh()
+                matrix._last_check = time.monotonic()
+                _matrix = matrix
+    _matrix.refresh_if_stale()
+    return _matrix
@@ -0,0 +1,116 @@
+import re
+
+
+# Words that carry no search meaning once the intent has been detected
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "do", "does", "you", "have", "has", "any",
+    "me", "show", "find", "what", "whats", "what's", "which", "how", "many",
+    "much", "of", "for", "in", "on", "to", "i", "my", "we", "can", "please",
+    "there", "some", "tell", "about", "get", "give", "list", "want", "looking",
+    "need", "with", "by", "it", "this", "that", "and", "or", "your",
+    "stock", "left", "quantity", "available", "availability", "inventory",
+    "category", "categories", "department", "products", "product", "items",
+    "order", "orders", "status", "id", "number",
+    "near", "nearby", "closest", "nearest", "close", "location",
+    "top", "best", "most", "sold", "selling", "sellers", "seller", "popular", "trending",
+}
+
+INTENT_PATTERNS = [
+    ("order_status", re.compile(r"\borders?\b.*\d+|\bmy\s+orders?\b|\b(?:track|tracking|shipped|delivered)\b", re.IGNORECASE)),
+    ("stock_nearby", re.compile(r"\b(?:near\s+(?:me|my)|nearby|closest|nearest|close\s+to\s+me)\b", re.IGNORECASE)),
+    ("top_products", re.compile(r"\b(?:top|best[\s-]?sell\w*|most\s+(?:sold|popular)|popular|trending)\b", re.IGNORECASE)),
+    ("stock_check", re.compile(r"\b(?:in\s+stock|stock|left|quantity|available|availability|inventory)\b", re.IGNORECASE)),
+    ("category_browse", re.compile(r"\b(?:category|categories|department)\b", re.IGNORECASE)),
+]
+
+GREETING_PATTERN = re.compile(r"^\s*(?:hi|hello|hey|good\s+(?:morning|afternoon|evening))\b", re.IGNORECASE)
+
+HELP_TEXT = (
+    "I can help you with:\n"
+    "- Product search (e.g. \"do you have denim jackets?\")\n"
+    "- Stock levels (e.g. \"how many Classic T-Shirts are left?\")\n"
+    "- Order status (e.g. \"status of order 12345\")\n"
+    "- Top selling products\n"
+    "- Browsing a category (e.g. \"show me products in the Jeans category\")"
+)
+
+RESPONSE_HEADERS = {
+    "products": "Here's what I found:",
+    "stock": "Here are the current stock levels:",
+    "nearby_stock": "Here's where you can find it closest to you:",
+    "order": "Here are the details of your order:",
+    "orders": "Here are the details of your orders:",
+    "top_products": "These are our best sellers right now:",
+    "category": "Here are some products from that category:",
+}
+
+
+def extract_search_terms(query):
+    """Strip intent words and stopwords, keeping the terms worth matching on"""
+    words = re.findall(r"[\w'-]+", query)
+    return [word for word in words if word.lower() not in STOPWORDS and not word.isdigit()]
+
+
+CLAUSE_SPLIT = re.compile(r"\b(?:and|also|plus)\b|[,;?]", re.IGNORECASE)
+
+
+def _classify_clause(text):
+    query_type = "product_search"
+    for intent, pattern in INTENT_PATTERNS:
+        if pattern.search(text):
+            query_type = intent
+            break
+
+    search_terms = extract_search_terms(text)
+    if query_type == "product_search" and (not search_terms or GREETING_PATTERN.match(text)):
+        query_type = "unclear"
+
+    return {"query_type": query_type, "search_terms": [" ".join(search_terms)] if search_terms else []}
+
+
+def classify_query(query):
+    """Rule-based intent classification returning the same shape as the LLM analysis"""
+    analysis = _classify_clause(query)
+
+    # Compound questions: only split when the clauses ask for different kinds of data,
+    # so "black and white shirts" stays a single product search
+    clauses = [clause for clause in CLAUSE_SPLIT.split(query) if clause.strip()]
+    intents = [_classify_clause(clause) for clause in clauses]
+    intents = [intent for intent in intents if intent["query_type"] != "unclear"]
+    if len({intent["query_type"] for intent in intents}) > 1:
+        analysis = dict(intents[0], intents=intents)
+
+    return {
+        "query_type": analysis["query_type"],
+        "data_needed": analysis["query_type"],
+        "clarifying_questions": [],
+        "search_terms": analysis["search_terms"],
+        "intents": analysis.get("intents", [analysis]),
+    }
+
+
+def build_template_response(data_context, summarize):
+    """Build a chat response without calling the LLM; summarize(data_context) formats retrieved data"""
+    data_type = data_context.get("type", "no_data")
+    content = data_context.get("content")
+
+    if data_type == "multi":
+        # One section per intent, each summarized on its own (a summary may itself contain blank lines)
+        text = "\n\n".join(
+            f"{RESPONSE_HEADERS.get(part.get('type'), 'Here is what I found:')}\n{summarize(part)}"
+            for part in content
+        )
+    elif data_type == "no_data":
+        text = f"I'm not sure what you're looking for. {HELP_TEXT}"
+    elif not content:
+        text = f"{summarize(data_context)}\n\nPlease check the details and try again, or ask me something else."
+    else:
+        header = RESPONSE_HEADERS.get(data_type, "Here's what I found:")
+        text = f"{header}\n\n{summarize(data_context)}"
+
+    return {
+        "response": text,
+        "type": data_type if data_type != "no_data" else "general",
+        "data": content if data_type != "no_data" else None,
+        "mode": "template",
+    }
@@ -0,0 +1,278 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from fake_llm_server import FakeLLMHandler
+from services.llm_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    LLMPolicy,
+    ResilientLLMClient,
+)
+
+
+class APIStatusError(Exception):
+    """Stand-in for groq.APIStatusError, which carries the HTTP status as status_code"""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class ScriptedHandler(FakeLLMHandler):
+    """FakeLLMHandler that takes (latency, status) per request from a script, then behaves normally"""
+
+    script = []
+    requests = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        with self.lock:
+            type(self).requests += 1
+            latency, status = self.script.pop(0) if self.script else (self.latency, 200)
+        if status != 200:
+            time.sleep(latency)
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self._send(status, {"error": {"message": "Scripted failure"}})
+            return
+        self.latency = latency
+        super().do_POST()
+
+
+class FakeServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops concurrent connects into a 1s SYN retry
+    request_queue_size = 64
+
+
+@pytest.fixture
+def fake_server():
+    handler = type("Handler", (ScriptedHandler,), {"script": [], "requests": 0, "latency": 0.0})
+    server = FakeServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    handler.url = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    yield handler
+    server.shutdown()
+    server.server_close()
+
+
+def completion_fn(handler):
+    def create(timeout, **kwargs):
+        request = urllib.request.Request(
+            handler.url, data=json.dumps(kwargs).encode(), headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            raise APIStatusError(e.code) from e
+        except urllib.error.URLError as e:
+            raise ConnectionError(str(e.reason)) from e
+
+    return create
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_client(handler, clock=time.monotonic, **policy):
+    return ResilientLLMClient(completion_fn(handler), LLMPolicy(**policy), sleep=lambda seconds: None, clock=clock)
+
+
+def chat(client, **kwargs):
+    return client.chat(model="fake-model", messages=[{"role": "user", "content": "hi"}], **kwargs)
+
+
+def test_retries_server_errors_until_success(fake_server):
+    fake_server.script = [(0.0, 503), (0.0, 503)]
+    client = make_client(fake_server, max_retries=2)
+
+    response = chat(client)
+
+    assert response["choices"][0]["message"]["content"]
+    assert fake_server.requests == 3
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_gives_up_after_max_retries(fake_server):
+    fake_server.script = [(0.0, 503)] * 3
+    client = make_client(fake_server, max_retries=1)
+
+    with pytest.raises(APIStatusError):
+        chat(client)
+    assert fake_server.requests == 2
+
+
+def test_caller_errors_are_not_retried_and_do_not_trip_the_breaker(fake_server):
+    fake_server.script = [(0.0, 400), (0.0, 401)]
+    client = make_client(fake_server, max_retries=2, failure_threshold=1)
+
+    for _ in range(2):
+        with pytest.raises(APIStatusError):
+            chat(client)
+
+    assert fake_server.requests == 2
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert client.breaker.failures == 0
+
+
+def test_timeouts_are_retried_within_the_deadline(fake_server):
+    fake_server.script = [(0.5, 200)]
+    client = make_client(fake_server, call_timeout=0.1, max_retries=1)
+
+    response = chat(client)
+
+    assert response["choices"]
+    assert fake_server.requests == 2
+
+
+def test_hedged_request_beats_slow_primary(fake_server):
+    fake_server.script = [(1.0, 200), (0.0, 200)]
+    client = make_client(fake_server, hedge=True, hedge_delay=0.05, call_timeout=3.0)
+
+    started = time.monotonic()
+    response = chat(client)
+
+    assert response["choices"]
+    assert time.monotonic() - started < 0.8
+    assert fake_server.requests == 2
+
+
+def test_no_hedge_without_delay_or_latency_history(fake_server):
+    client = make_client(fake_server, hedge=True)
+
+    assert client.hedge_delay() is None
+    chat(client)
+    assert fake_server.requests == 1
+
+
+def test_hedge_delay_tracks_recent_latency_quantile(fake_server):
+    client = make_client(fake_server, hedge=True, hedge_delay=0.5, latency_window=20, min_latency_samples=10)
+    for _ in range(9):
+        client.latencies.record(0.1)
+    assert client.hedge_delay() == 0.5
+
+    for latency in [0.1] * 19 + [0.9]:
+        client.latencies.record(latency)
+    assert client.hedge_delay() == 0.9
+
+    for _ in range(20):
+        client.latencies.record(0.2)
+    assert client.hedge_delay() == pytest.approx(0.2)
+
+
+def test_hedge_delay_learned_from_served_calls(fake_server):
+    client = make_client(fake_server, hedge=True, min_latency_samples=3)
+    for _ in range(3):
+        chat(client)
+
+    delay = client.hedge_delay()
+    assert delay is not None and delay < 0.5
+
+
+def test_breaker_opens_fails_fast_and_recovers_through_a_probe(fake_server):
+    clock = FakeClock()
+    fake_server.script = [(0.0, 503)] * 2
+    client = make_client(fake_server, clock=clock, max_retries=0, failure_threshold=2, reset_timeout=30.0)
+
+    for _ in range(2):
+        with pytest.raises(APIStatusError):
+            chat(client)
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        chat(client)
+    assert fake_server.requests == 2
+
+    clock.now += 31
+    assert chat(client)["choices"]
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert fake_server.requests == 3
+
+
+def test_failed_probe_reopens_the_breaker(fake_server):
+    clock = FakeClock()
+    fake_server.script = [(0.0, 503)] * 2
+    client = make_client(fake_server, clock=clock, max_retries=0, failure_threshold=1, reset_timeout=30.0)
+
+    with pytest.raises(APIStatusError):
+        chat(client)
+    clock.now += 31
+    with pytest.raises(APIStatusError):
+        chat(client)
+
+    assert client.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        chat(client)
+
+
+def test_exhausted_deadline_does_not_consume_the_half_open_probe(fake_server):
+    clock = FakeClock()
+    fake_server.script = [(0.0, 503)]
+    client = make_client(fake_server, clock=clock, max_retries=0, failure_threshold=1, reset_timeout=30.0)
+
+    with pytest.raises(APIStatusError):
+        chat(client)
+    clock.now += 31
+
+    with pytest.raises(DeadlineExceededError):
+        chat(client, deadline=clock.now)
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    assert chat(client)["choices"]
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_is_released_when_the_call_fails_for_unrelated_reasons():
+    clock = FakeClock()
+    calls = []
+
+    def broken(timeout, **kwargs):
+        calls.append(timeout)
+        raise ValueError("bad arguments")
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0, clock=clock)
+    breaker.record_failure()
+    clock.now += 31
+    client = ResilientLLMClient(broken, LLMPolicy(max_retries=0), breaker=breaker, clock=clock)
+
+    with pytest.raises(ValueError):
+        client.chat(messages=[])
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow_request()
+
+
+def test_concurrent_hedged_calls_start_promptly_and_send_nothing_late(fake_server):
+    fake_server.latency = 0.3
+    client = make_client(fake_server, hedge=True, hedge_delay=0.25, call_timeout=3.0)
+    latencies = []
+
+    def call():
+        started = time.monotonic()
+        chat(client)
+        latencies.append(time.monotonic() - started)
+
+    threads = [threading.Thread(target=call) for _ in range(24)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sent = fake_server.requests
+
+    # Primaries never wait for a pool worker, and hedges only use free workers
+    assert len(latencies) == 24
+    assert max(latencies) < 0.7
+    assert sent <= 24 + 8
+    time.sleep(0.5)
+    assert fake_server.requests == sent
@@ -0,0 +1,45 @@
+import pytest
+
+from models.memory_store import InMemoryCatalog
+from services.chat_service import ChatbotService
+
+
+def make_catalog():
+    jackets = [
+        {"product_id": "7", "product_name": "Classic Denim Jacket", "product_brand": "Levi's",
+         "product_category": "Jackets", "product_retail_price": 80.0,
+         "product_distribution_center_id": 1, "sold_at": "2024-01-02"},
+        {"product_id": "8", "product_name": "Quilted Puffer Jacket", "product_brand": "North",
+         "product_category": "Jackets", "product_retail_price": 120.0,
+         "product_distribution_center_id": 1},
+    ]
+    orders = [
+        {"order_id": order_id, "user_id": 1, "status": status, "num_of_item": 1, "created_at": "2024-01-01"}
+        for order_id, status in ((100, "Shipped"), (101, "Processing"))
+    ]
+    return InMemoryCatalog(
+        products=[{"_id": 7, "name": "Classic Denim Jacket", "brand": "Levi's"}],
+        inventory_items=jackets,
+        orders=orders,
+        order_items=[{"order_id": 100, "product_id": 7, "status": "Shipped", "sale_price": 80.0}],
+        distribution_centers=[{"id": 1, "name": "Memphis TN", "latitude": 35.1, "longitude": -89.9}],
+    )
+
+
+@pytest.fixture
+def chatbot(monkeypatch):
+    monkeypatch.setenv("LLM_DISABLED", "true")
+    return ChatbotService(make_catalog(), conversation_manager=None)
+
+
+def test_multi_intent_template_keeps_every_order_under_its_header(chatbot):
+    response = chatbot.process_query("status of orders 100 and 101 and what are the top jackets", use_llm=False)
+
+    assert response["type"] == "multi"
+    text = response["response"]
+    best_sellers, orders = text.split("\n\nHere are the details of your orders:\n")
+    assert best_sellers.startswith("These are our best sellers right now:\n")
+    assert "Classic Denim Jacket" in best_sellers
+    # Both orders stay in their own section, although their summaries are separated by a blank line
+    assert "Order #100" in orders and "Order #101" in orders
+    assert "- Status: Processing" in orders